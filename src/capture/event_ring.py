@@ -0,0 +1,106 @@
+from __future__ import annotations
+from multiprocessing import shared_memory
+from typing import Optional
+import struct, threading, time
+
+# Header: head, tail, capacity, dropped (u64), heartbeat (f64), stop flag (u8)
+HEADER = struct.Struct("<QQQQdB23x")
+HEADER_SIZE = HEADER.size
+HEAD_OFFSET, TAIL_OFFSET, CAPACITY_OFFSET, DROPPED_OFFSET, HEARTBEAT_OFFSET, STOP_OFFSET = 0, 8, 16, 24, 32, 40
+
+# Record: time, kind, flags, code, x, y
+RECORD = struct.Struct("<dBBHii4x")
+RECORD_SIZE = RECORD.size
+
+_U64 = struct.Struct("<Q")
+_F64 = struct.Struct("<d")
+
+
+class EventRing:
+    """
+    Single-producer / single-consumer ring of fixed-size input event records in
+    ``multiprocessing.shared_memory``.
+
+    The producer (hook process) only ever advances ``head`` and the consumer
+    only ``tail``, so no cross-process lock is needed. ``put`` never blocks:
+    when the ring is full the event is dropped and counted.
+    """
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.buf = shm.buf
+        self.owner = owner
+        self.capacity: int = _U64.unpack_from(self.buf, CAPACITY_OFFSET)[0]
+        # Several hook threads may produce within the hook process
+        self.put_lock = threading.Lock()
+
+    @classmethod
+    def create(cls, capacity: int = 65536) -> "EventRing":
+        shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + capacity * RECORD_SIZE)
+        HEADER.pack_into(shm.buf, 0, 0, 0, capacity, 0, time.time(), 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "EventRing":
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    # Producer side
+
+    def put(self, t: float, kind: int, flags: int = 0, code: int = 0, x: int = 0, y: int = 0) -> bool:
+        """Write one record; returns False (and counts a drop) when the ring is full"""
+        buf = self.buf
+        with self.put_lock:
+            head = _U64.unpack_from(buf, HEAD_OFFSET)[0]
+            if head - _U64.unpack_from(buf, TAIL_OFFSET)[0] >= self.capacity:
+                _U64.pack_into(buf, DROPPED_OFFSET, _U64.unpack_from(buf, DROPPED_OFFSET)[0] + 1)
+                return False
+            RECORD.pack_into(buf, HEADER_SIZE + (head % self.capacity) * RECORD_SIZE, t, kind, flags, code, x, y)
+            # Publish only after the record is complete
+            _U64.pack_into(buf, HEAD_OFFSET, head + 1)
+        return True
+
+    def heartbeat(self):
+        _F64.pack_into(self.buf, HEARTBEAT_OFFSET, time.time())
+
+    def should_stop(self) -> bool:
+        return self.buf[STOP_OFFSET] != 0
+
+    # Consumer side
+
+    def read_batch(self, max_records: int = 4096) -> list[tuple]:
+        """Pop up to ``max_records`` records as ``(t, kind, flags, code, x, y)`` tuples"""
+        buf = self.buf
+        tail = _U64.unpack_from(buf, TAIL_OFFSET)[0]
+        n = min(_U64.unpack_from(buf, HEAD_OFFSET)[0] - tail, max_records)
+        if n <= 0:
+            return []
+
+        start = tail % self.capacity
+        first = min(n, self.capacity - start)
+        offset = HEADER_SIZE + start * RECORD_SIZE
+        records = list(RECORD.iter_unpack(buf[offset:offset + first * RECORD_SIZE]))
+        if first < n:
+            records += RECORD.iter_unpack(buf[HEADER_SIZE:HEADER_SIZE + (n - first) * RECORD_SIZE])
+        _U64.pack_into(buf, TAIL_OFFSET, tail + n)
+        return records
+
+    def pending(self) -> int:
+        return _U64.unpack_from(self.buf, HEAD_OFFSET)[0] - _U64.unpack_from(self.buf, TAIL_OFFSET)[0]
+
+    def dropped(self) -> int:
+        return _U64.unpack_from(self.buf, DROPPED_OFFSET)[0]
+
+    def last_heartbeat(self) -> float:
+        return _F64.unpack_from(self.buf, HEARTBEAT_OFFSET)[0]
+
+    def request_stop(self, stop: bool = True):
+        self.buf[STOP_OFFSET] = 1 if stop else 0
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
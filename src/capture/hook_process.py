@@ -0,0 +1,307 @@
+from __future__ import annotations
+from typing import Callable, Optional
+import argparse, gc, logging, multiprocessing as mp, os, statistics, threading, time
+
+from src.capture.event_ring import EventRing
+from src.capture.synthetic import SyntheticEventDriver
+from src.utils.events import (
+    KIND_KEY_DOWN, KIND_KEY_UP, KIND_MOVE, KIND_CLICK_DOWN, KIND_CLICK_UP, KIND_SCROLL, BUTTON_CODES
+)
+
+# Record flags for key events
+FLAG_SPECIAL = 1  # code indexes the sorted pynput ``Key`` member names
+FLAG_VK = 2       # code is a virtual key code
+
+
+def _key_names() -> list[str]:
+    from pynput import keyboard
+    return sorted(keyboard.Key.__members__)
+
+
+def encode_key(key, key_index: dict) -> tuple[int, int]:
+    """Encode a pynput key as (flags, code) for the ring"""
+    char = getattr(key, "char", None)
+    if char is not None and len(char) == 1 and ord(char) <= 0xFFFF:
+        return 0, ord(char)
+    name = getattr(key, "name", None)
+    if name in key_index:
+        return FLAG_SPECIAL, key_index[name]
+    vk = getattr(key, "vk", None)
+    return FLAG_VK, (vk or 0) & 0xFFFF
+
+
+class EventDecoder:
+    """Turns ring records back into pynput objects for the capture handlers"""
+    def __init__(self):
+        from pynput import keyboard, mouse
+        self.keyboard = keyboard
+        self.key_names = _key_names()
+        self.buttons = {code: getattr(mouse.Button, name) for name, code in BUTTON_CODES.items()}
+        self.unknown_button = getattr(mouse.Button, "unknown", mouse.Button.left)
+        self.keys: dict = {}
+
+    def key(self, flags: int, code: int):
+        key = self.keys.get((flags, code))
+        if key is None:
+            if flags & FLAG_SPECIAL:
+                key = self.keyboard.Key[self.key_names[code]]
+            elif flags & FLAG_VK:
+                key = self.keyboard.KeyCode.from_vk(code)
+            else:
+                key = self.keyboard.KeyCode.from_char(chr(code))
+            self.keys[(flags, code)] = key
+        return key
+
+    def button(self, code: int):
+        return self.buttons.get(code, self.unknown_button)
+
+
+def hook_main(shm_name: str):
+    """
+    Entry point of the hook process: install the pynput hooks and write
+    every event to the ring. Nothing else runs here, so callbacks return fast.
+    """
+    from pynput import keyboard, mouse
+
+    ring = EventRing.attach(shm_name)
+    key_index = {name: i for i, name in enumerate(_key_names())}
+    now = time.time
+
+    def on_press(key):
+        ring.put(now(), KIND_KEY_DOWN, *encode_key(key, key_index))
+
+    def on_release(key):
+        ring.put(now(), KIND_KEY_UP, *encode_key(key, key_index))
+
+    def on_move(x, y):
+        ring.put(now(), KIND_MOVE, 0, 0, int(x), int(y))
+
+    def on_click(x, y, button, pressed):
+        ring.put(now(), KIND_CLICK_DOWN if pressed else KIND_CLICK_UP, 0,
+                 BUTTON_CODES.get(getattr(button, "name", ""), 0), int(x), int(y))
+
+    def on_scroll(_x, _y, dx, dy):
+        ring.put(now(), KIND_SCROLL, 0, 0, int(dx), int(dy))
+
+    kb_listener = keyboard.Listener(on_press=on_press, on_release=on_release)
+    mouse_listener = mouse.Listener(on_move=on_move, on_click=on_click, on_scroll=on_scroll)
+    kb_listener.start()
+    mouse_listener.start()
+
+    parent = os.getppid()
+    try:
+        while not ring.should_stop() and os.getppid() == parent:
+            ring.heartbeat()
+            time.sleep(0.25)
+    finally:
+        kb_listener.stop()
+        mouse_listener.stop()
+        ring.close()
+
+
+class HookSupervisor:
+    """
+    Runs the input hooks in a dedicated process and feeds their events to the
+    capture objects of this process in batches. The hook process is restarted
+    when it dies or stops sending heartbeats.
+    """
+    def __init__(self, kb, mouse, logger: logging.Logger, capacity: int = 65536,
+                 poll_interval: float = 0.005, heartbeat_timeout: float = 5.0,
+                 target: Callable = hook_main, args: tuple = ()):
+        self.kb = kb
+        self.mouse = mouse
+        self.logger = logger
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.target = target
+        self.args = args
+
+        self.ring: Optional[EventRing] = None
+        self.process = None
+        self.decoder: Optional[EventDecoder] = None
+        self.running = False
+        self.stopped = threading.Event()
+        self.threads: list[threading.Thread] = []
+        self.restarts = 0
+        self.consumed = 0
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.stopped.clear()
+        self.ring = EventRing.create(self.capacity)
+        if self.kb is not None or self.mouse is not None:
+            self.decoder = EventDecoder()
+        self._spawn()
+        self.threads = [
+            threading.Thread(target=self._consume, daemon=True),
+            threading.Thread(target=self._supervise, daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+        self.logger.info("Hook process started")
+
+    def _spawn(self):
+        self.ring.request_stop(False)
+        self.ring.heartbeat()
+        self.process = mp.get_context("spawn").Process(
+            target=self.target, args=(self.ring.name, *self.args), daemon=True
+        )
+        self.process.start()
+
+    def _supervise(self):
+        while not self.stopped.wait(1):
+            stale = time.time() - self.ring.last_heartbeat() > self.heartbeat_timeout
+            if self.process.is_alive() and not stale:
+                continue
+            self.logger.warning(
+                f"Hook process {'unresponsive' if stale else 'exited'}, restarting "
+                f"({self.ring.dropped()} events dropped so far)"
+            )
+            self.process.kill()
+            self.process.join(timeout=2)
+            self._spawn()
+            self.restarts += 1
+
+    def _consume(self):
+        while not self.stopped.is_set():
+            if not self._drain():
+                time.sleep(self.poll_interval)
+
+    def _drain(self) -> int:
+        """Dispatch the records waiting in the ring, returns how many"""
+        batch = self.ring.read_batch()
+        for record in batch:
+            self.dispatch(record)
+        self.consumed += len(batch)
+        return len(batch)
+
+    def dispatch(self, record: tuple):
+        """Call the capture handler matching a ring record"""
+        t, kind, flags, code, x, y = record
+        if kind == KIND_MOVE:
+            self.mouse._on_move(x, y, t)
+        elif kind == KIND_KEY_DOWN:
+            self.kb._on_press(self.decoder.key(flags, code), t)
+        elif kind == KIND_KEY_UP:
+            self.kb._on_release(self.decoder.key(flags, code), t)
+        elif kind == KIND_CLICK_DOWN or kind == KIND_CLICK_UP:
+            self.mouse._on_click(x, y, self.decoder.button(code), kind == KIND_CLICK_DOWN, t)
+        elif kind == KIND_SCROLL:
+            self.mouse._on_scroll(0, 0, x, y, t)
+
+    def metrics(self) -> dict:
+        return {
+            "consumed": self.consumed,
+            "pending": self.ring.pending() if self.ring else 0,
+            "dropped": self.ring.dropped() if self.ring else 0,
+            "restarts": self.restarts,
+        }
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.ring.request_stop()
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        # The consumer and supervisor read the shared buffer: join them before it is closed
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+        while self._drain():
+            pass
+        self.ring.close()
+        self.logger.info("Hook process stopped")
+
+
+# Benchmark
+
+def _percentiles(lateness: list[float]) -> dict:
+    values = sorted(lateness)
+    if not values:
+        return {}
+    return {
+        "events": len(values),
+        "p50_us": round(statistics.median(values) * 1e6, 1),
+        "p99_us": round(values[int(len(values) * 0.99) - 1] * 1e6, 1),
+        "max_us": round(values[-1] * 1e6, 1),
+    }
+
+
+def _bench_producer(shm_name: str, rate: float, duration: float, results):
+    """Synthetic hook: emits events at ``rate`` and records how late each put completes"""
+    ring = EventRing.attach(shm_name)
+    lateness: list[float] = []
+    SyntheticEventDriver(rate).run(lambda event: ring.put(*event), duration, on_late=lateness.append)
+    results.put(_percentiles(lateness))
+    ring.close()
+
+
+def _consumer_load(ring: EventRing, heavy: bool, stop: threading.Event):
+    """Drain the ring; under heavy load burn CPU and trigger GC like summarization/SQLite/scoring would"""
+    batches = 0
+    while not stop.is_set():
+        batch = ring.read_batch()
+        if not batch and not heavy:
+            time.sleep(0.005)
+            continue
+        if heavy:
+            end = time.perf_counter() + 0.02
+            acc = 0
+            while time.perf_counter() < end:
+                acc += sum(i * i for i in range(200))
+            batches += 1
+            if batches % 25 == 0:
+                garbage = [[i] for i in range(200_000)]
+                del garbage
+                gc.collect()
+
+
+def run_benchmark(rate: float, duration: float) -> list[dict]:
+    results = []
+    for mode in ("thread", "process"):
+        for heavy in (False, True):
+            ring = EventRing.create()
+            stop = threading.Event()
+            consumer = threading.Thread(target=_consumer_load, args=(ring, heavy, stop), daemon=True)
+            consumer.start()
+
+            if mode == "process":
+                queue = mp.get_context("spawn").Queue()
+                proc = mp.get_context("spawn").Process(
+                    target=_bench_producer, args=(ring.name, rate, duration, queue)
+                )
+                proc.start()
+                stats = queue.get()
+                proc.join()
+            else:
+                lateness: list[float] = []
+                SyntheticEventDriver(rate).run(lambda event: ring.put(*event), duration, on_late=lateness.append)
+                stats = _percentiles(lateness)
+
+            stop.set()
+            consumer.join()
+            results.append({"hooks": mode, "consumer": "heavy" if heavy else "light",
+                            **stats, "dropped": ring.dropped()})
+            ring.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hook-side latency benchmark, in-process vs hook process")
+    parser.add_argument("--rate", type=float, default=1000, help="Synthetic events per second")
+    parser.add_argument("--duration", type=float, default=5, help="Seconds per scenario")
+    args = parser.parse_args()
+
+    print(f"{'hooks':<8}{'consumer':<10}{'events':>8}{'p50 us':>10}{'p99 us':>10}{'max us':>10}{'dropped':>9}")
+    for r in run_benchmark(args.rate, args.duration):
+        print(f"{r['hooks']:<8}{r['consumer']:<10}{r['events']:>8}{r['p50_us']:>10}"
+              f"{r['p99_us']:>10}{r['max_us']:>10}{r['dropped']:>9}")
+
+
+if __name__ == "__main__":
+    main()
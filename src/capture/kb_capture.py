@@ -1,21 +1,35 @@
 from pynput import keyboard
-from typing import List, Optional
+from typing import Optional
 
+from src.capture.sampling import SampledSeries, capacity_for
+from src.features.keystroke_timing import TimingMatrix, key_class, digraph
+from src.utils.events import KIND_KEY_DOWN, KIND_KEY_UP
 from src.utils.logging import setup_logging
 
-import time, statistics, threading
+import time, threading
 
 logger = setup_logging("debug")
 
+# (key string, key class) interned by character and by special key name, the
+# attributes key_class reads; KeyCode hashes its repr so it cannot be the key
+_CHAR_KEYS: dict = {}
+_NAMED_KEYS: dict = {}
+
 class KeyboardCapture:
     SENTENCE_TIMEOUT: int = 1
+    # Sampled accumulators journaled incrementally by SessionJournal
+    CHECKPOINT_SERIES = ("keystroke", "shortcut", "type_speed")
 
-    def __init__(self):
+    def __init__(self, memory_budget: int = 8 * 1024 * 1024):
+        """
+        :param memory_budget: bytes of detailed samples kept per session, beyond it samples are reservoir-sampled
+        """
+        capacity = capacity_for(memory_budget, ["d"] * len(self.CHECKPOINT_SERIES))
 
         self.current_pressed_keys_time: dict = {}
 
-        self.keystroke: List[float] = []
-        self.shortcut: List[float] = []
+        self.keystroke = SampledSeries(capacity)
+        self.shortcut = SampledSeries(capacity)
 
         self.shortcut_modifier_time: float = 0
         self.active_shortcut_keys: list[str] = []
@@ -25,18 +39,36 @@ class KeyboardCapture:
         self.temp_no_of_chars: int = 0
         self.last_key_time: float = 0
         self.reset_sentence_timer: Optional[threading.Timer] = None
-        self.type_speed: List[float] = []
+        self.type_speed = SampledSeries(capacity)
+
+        # Digraph timing model: flight histograms by (previous, current) key class,
+        # dwell histograms on the (class, class) cell of the key itself
+        self.dwell = TimingMatrix()
+        self.flight = TimingMatrix()
+        self.current_pressed_keys_cell: dict = {}
+        self.last_class: Optional[int] = None
+        self.last_key_str: Optional[str] = None
+        self.last_release_time: float = 0
+
+        # Optional raw event log (SegmentWriter), records key classes only
+        self.raw_sink = None
 
         self.listener: Optional[keyboard.Listener] = None
         self.is_running = False
 
-    def start_capture(self):
-        """Start capturing keyboard events in a separate thread"""
+    def start_capture(self, listen: bool = True):
+        """
+        Start capturing keyboard events in a separate thread
+        :param listen: when False no hook is installed, events are fed by an external source (hook process)
+        """
         if self.is_running:
             logger.warning("Capture already running")
             return
 
         self.is_running = True
+        if not listen:
+            logger.info("Keyboard capture started (external hook)")
+            return
         self.listener = keyboard.Listener(
             on_press=self._on_press,
             on_release=self._on_release
@@ -71,19 +103,56 @@ class KeyboardCapture:
         self.keystroke.clear()
         self.shortcut.clear()
         self.type_speed.clear()
+        self.dwell.clear()
+        self.flight.clear()
+        self.current_pressed_keys_cell.clear()
+        self.last_class = None
+        self.last_key_str = None
+        self.last_release_time = 0
         logger.debug("All data cleared")
 
+    def event_count(self) -> int:
+        """Number of key events captured since the last clear"""
+        return len(self.keystroke) + len(self.shortcut)
+
+    def get_checkpoint_state(self) -> dict:
+        """Fixed-size state saved with each journal checkpoint"""
+        return {"dwell": self.dwell.to_sparse(), "flight": self.flight.to_sparse()}
+
+    def load_checkpoint(self, series: dict, state: dict):
+        """Restore accumulators replayed from the session journal"""
+        for field in self.CHECKPOINT_SERIES:
+            for delta in series.get(field, []):
+                getattr(self, field).apply_delta(delta)
+        self.dwell.load_sparse(state.get("dwell", {}))
+        self.flight.load_sparse(state.get("flight", {}))
+
     @staticmethod
     def _key_to_string(key: keyboard.Key) -> str:
         """Convert key object to string representation"""
         try:
             if "Key" in str(key):
                 return str(key).replace('Key.', '')
-            else:
-                return f"{key}"
+            return f"{key}"
         except AttributeError:
             return str(key)
 
+    @classmethod
+    def _key_info(cls, key) -> tuple[str, int]:
+        """String representation and key class of a key, computed once per key"""
+        char = getattr(key, "char", None)
+        if char is not None:
+            interned, ident = _CHAR_KEYS, char
+        else:
+            interned, ident = _NAMED_KEYS, getattr(key, "name", None)
+            if ident is None:
+                # KeyCode known only by its virtual key code
+                return cls._key_to_string(key), key_class(key)
+        info = interned.get(ident)
+        if info is None:
+            info = interned[ident] = (cls._key_to_string(key), key_class(key))
+        return info
+
     @staticmethod
     def _is_printable_char(key) -> bool:
         """Check if key represents a printable character"""
@@ -92,14 +161,14 @@ class KeyboardCapture:
         except AttributeError:
             return False
 
-    def _is_shortcut_active(self, key: str) -> bool:
+    def _is_shortcut_active(self, key: str, current_time: float) -> bool:
         """Detect if current pressed keys form a shortcut"""
 
         # Common modifier keys
         modifiers = {'ctrl_l', 'ctrl_r', 'alt_l', 'alt_gr', 'shift', 'shift_r', 'cmd', 'super'}
         is_modifier = key in modifiers
         if is_modifier:
-            self.shortcut_modifier_time = time.time()
+            self.shortcut_modifier_time = current_time
 
         return is_modifier
 
@@ -126,7 +195,7 @@ class KeyboardCapture:
 
             if time_elapsed > 0:
                 chars_per_minute = (self.temp_no_of_chars / time_elapsed) * 60
-                logger.debug(f"Sentence over! typing speed {chars_per_minute} cpm")
+                logger.debug("Sentence over! typing speed %s cpm", chars_per_minute)
                 self.type_speed.append(chars_per_minute)
 
         self.is_sentence = False
@@ -134,34 +203,60 @@ class KeyboardCapture:
         self.temp_no_of_chars = 0
         self.reset_sentence_timer = None
 
-    def _on_press(self, key):
-        """Handle keystroke press events"""
-        key_str = self._key_to_string(key)
+    def _update_timing(self, key_str: str, cls: int, current_time: float):
+        """Record the flight time of the digraph ending with this key press"""
+        if self.last_class is not None and current_time - self.last_key_time <= self.SENTENCE_TIMEOUT:
+            cell = digraph(self.last_class, cls)
+            # Previous key still held down: rollover, counted as a negative flight
+            if self.last_key_str in self.current_pressed_keys_time:
+                self.flight.add(cell, -1.0)
+            else:
+                self.flight.add(cell, current_time - self.last_release_time)
+        self.current_pressed_keys_cell[key_str] = digraph(cls, cls)
+        self.last_class = cls
+        self.last_key_str = key_str
+
+    def _on_press(self, key, t: Optional[float] = None):
+        """Handle keystroke press events (``t``: event time when dispatched from the hook process)"""
+        key_str, cls = self._key_info(key)
         if key_str in self.current_pressed_keys_time:
             return
 
-        current_time = time.time()
+        current_time = t or time.time()
+        if self.raw_sink is not None:
+            self.raw_sink.append(current_time, KIND_KEY_DOWN, cls)
+        self._update_timing(key_str, cls, current_time)
         self.last_key_time = current_time
         self.current_pressed_keys_time[key_str] = current_time
 
-        if (not self.is_sentence and self._is_shortcut_active(key_str)) or len(self.active_shortcut_keys) > 0:
+        if (not self.is_sentence and self._is_shortcut_active(key_str, current_time)) or len(self.active_shortcut_keys) > 0:
             self.active_shortcut_keys.append(key_str)
         else:
             self._update_type_speed(key, current_time)
 
-    def _on_release(self, key):
-        """Handle keystroke release events"""
-        current_time = time.time()
-        key_str = self._key_to_string(key)
+    def _on_release(self, key, t: Optional[float] = None):
+        """Handle keystroke release events (``t``: event time when dispatched from the hook process)"""
+        current_time = t or time.time()
+        key_str, cls = self._key_info(key)
+        if self.raw_sink is not None:
+            self.raw_sink.append(current_time, KIND_KEY_UP, cls)
 
         if key_str in self.current_pressed_keys_time:
             hold_time = current_time - self.current_pressed_keys_time[key_str]
+            # Flight times are measured from the release of the key pressed last
+            if key_str == self.last_key_str:
+                self.last_release_time = current_time
+
+            cell = self.current_pressed_keys_cell.pop(key_str, None)
+            if cell is not None:
+                self.dwell.add(cell, hold_time)
 
             if len(self.active_shortcut_keys) > 0:
                 hold_time = current_time - self.shortcut_modifier_time
                 self.shortcut.append(hold_time)
                 for key in self.active_shortcut_keys:
                     del self.current_pressed_keys_time[key]
+                    self.current_pressed_keys_cell.pop(key, None)
                 self.active_shortcut_keys.clear()
             else:
                 self.keystroke.append(hold_time)
@@ -171,32 +266,41 @@ class KeyboardCapture:
 
     def _get_keystroke_stats(self) -> dict:
         """Get statistics about keystrokes"""
-        all_keystrokes = self.keystroke
-        all_shortcuts = self.shortcut
-        all_hold_times = all_keystrokes + all_shortcuts
+        hold_count = self.keystroke.count + self.shortcut.count
 
         return {
-            "keystroke_count": len(all_keystrokes) or 0,
-            "shortcut_count": len(all_shortcuts) or 0,
-            "avg_hold_time": sum(all_hold_times) / len(all_hold_times) if all_hold_times else 0,
-            "all_hold_times": all_hold_times
+            "keystroke_count": self.keystroke.count,
+            "shortcut_count": self.shortcut.count,
+            "avg_hold_time": (self.keystroke.total + self.shortcut.total) / hold_count if hold_count else 0,
+            "all_hold_times": list(self.keystroke.samples) + list(self.shortcut.samples),
+            "sampling_rate": round(min(self.keystroke.sampling_rate, self.shortcut.sampling_rate), 4),
         }
 
     def _get_type_speed_stats(self) -> dict:
         """Get statistics about type-speed"""
         return {
-            "total_kb_sessions": len(self.type_speed),
-            "avg_cpm": round(statistics.mean(self.type_speed), 2) if self.type_speed else 0,
-            "median_cpm": round(statistics.median(self.type_speed), 2) if self.type_speed else 0,
-            "min_cpm": round(min(self.type_speed), 2) if self.type_speed else 0,
-            "max_cpm": round(max(self.type_speed), 2) if self.type_speed else 0,
-            "std_deviation": round(statistics.stdev(self.type_speed) if len(self.type_speed) > 1 else 0, 2),
-            "all_kb_sessions_cpm": [round(speed, 2) for speed in self.type_speed] if self.type_speed else 0,
+            "total_kb_sessions": self.type_speed.count,
+            "avg_cpm": round(self.type_speed.mean, 2) if self.type_speed else 0,
+            "median_cpm": round(self.type_speed.median(), 2) if self.type_speed else 0,
+            "min_cpm": round(self.type_speed.min, 2) if self.type_speed else 0,
+            "max_cpm": round(self.type_speed.max, 2) if self.type_speed else 0,
+            "std_deviation": round(self.type_speed.stdev, 2),
+            "all_kb_sessions_cpm": [round(speed, 2) for speed in self.type_speed.samples] if self.type_speed else 0,
+            "sampling_rate": round(self.type_speed.sampling_rate, 4),
+        }
+
+    def _get_timing_stats(self) -> dict:
+        """Get the digraph dwell/flight histograms"""
+        return {
+            "digraph_count": self.flight.total(),
+            "dwell": self.dwell,
+            "flight": self.flight,
         }
 
     def get_summary(self) -> dict:
         """Get a summary of all captured data"""
         return {
             "keystrokes": self._get_keystroke_stats(),
-            "type_speed": self._get_type_speed_stats()
+            "type_speed": self._get_type_speed_stats(),
+            "timing": self._get_timing_stats()
         }
\ No newline at end of file
@@ -1,40 +1,88 @@
 from pynput import mouse
-from typing import List, Tuple, Optional
+from typing import Dict, Optional
+import numpy as np
 
+from src.capture.sampling import Reservoir, SampledSeries, capacity_for
+from src.features.strokes import StrokeBuffer, SUMMARY_COLUMNS
 from src.utils.logging import setup_logging
+from src.utils.events import KIND_MOVE, KIND_CLICK_DOWN, KIND_CLICK_UP, KIND_SCROLL, BUTTON_CODES
 
-import time, statistics, threading
+import time, threading
 
 logger = setup_logging("debug")
 
 class MouseCapture:
 
     SCROLL_INTERVAL = 1
-
-    def __init__(self):
-        self.move_dx: List[float] = []
-        self.move_dy: List[float] = []
-        self.last_move_x: float = 0
-        self.last_move_y: float = 0
+    # Sampled accumulators journaled incrementally by SessionJournal
+    # Stroke feature -> series of its per-stroke values
+    STROKE_SERIES = {
+        "duration": "stroke_duration",
+        "straightness": "stroke_straightness",
+        "curvature": "stroke_curvature",
+        "mean_velocity": "stroke_velocity",
+        "peak_velocity_time": "stroke_peak_velocity_time",
+        "mean_acceleration": "stroke_acceleration",
+        "overshoot": "stroke_overshoot",
+        "click_to_target": "stroke_click_to_target",
+    }
+    CHECKPOINT_SERIES = ("move_dx", "move_dy", "scroll_dy", "click_intervals", "click_positions",
+                         *STROKE_SERIES.values())
+
+    def __init__(self, memory_budget: int = 8 * 1024 * 1024):
+        """
+        :param memory_budget: bytes of detailed samples kept per session, beyond it samples are reservoir-sampled
+        """
+        capacity = capacity_for(memory_budget, ["d", "d", "d", "d", None] + ["d"] * len(self.STROKE_SERIES))
+
+        self.move_dx = SampledSeries(capacity)
+        self.move_dy = SampledSeries(capacity)
+        # None until the first move, which only sets the reference position
+        self.last_move_x: Optional[float] = None
+        self.last_move_y: Optional[float] = None
+        # Moves closer than this to the last processed one are dropped (set by the resource governor)
+        self.move_interval: float = 0.0
+        self.last_move_time: float = 0
 
         self.is_scrolling: bool = False
         self.temp_scroll: int = 0
-        self.scroll_dy: List[float] = []
+        self.scroll_dy = SampledSeries(capacity)
 
-        self.click_times: List[float] = []
-        self.click_positions: List[Tuple[float, float]] = []
+        self.click_count: int = 0
+        self.first_click_time: float = 0
+        self.last_click_time: float = 0
+        self.click_intervals = SampledSeries(capacity)
+        self.click_positions = Reservoir(capacity, typecode=None)
         self.click_button: dict = {}
+        # Click counters are snapshotted by the journal thread while clicks update them
+        self.click_lock = threading.Lock()
+
+        # Moves and presses are segmented into strokes, whose features are sampled per stroke
+        self.strokes = StrokeBuffer(self._on_strokes)
+        for series in self.STROKE_SERIES.values():
+            setattr(self, series, SampledSeries(capacity))
+
+        self.last_event_time: float = 0
+
+        # Optional raw event log (SegmentWriter)
+        self.raw_sink = None
 
         self.listener: Optional[mouse.Listener] = None
         self.is_running = False
 
-    def start_capture(self):
-        """Start capturing mouse events in a separate thread"""
+    def start_capture(self, listen: bool = True):
+        """
+        Start capturing mouse events in a separate thread
+        :param listen: when False no hook is installed, events are fed by an external source (hook process)
+        """
         if self.is_running:
             logger.warning("Capture already running")
             return
 
         self.is_running = True
+        if not listen:
+            logger.info("Mouse capture started (external hook)")
+            return
         self.listener = mouse.Listener(
             on_move=self._on_move,
             on_click=self._on_click,
@@ -50,7 +98,8 @@ class MouseCapture:
             logger.warning("Capture not running")
             return
 
-        self.listener.stop()
+        if self.listener:
+            self.listener.stop()
         self.is_running = False
         logger.info("Mouse capture stopped")
 
@@ -59,10 +108,41 @@ class MouseCapture:
         self.move_dx.clear()
         self.move_dy.clear()
         self.scroll_dy.clear()
-        self.click_times.clear()
+        self.click_intervals.clear()
         self.click_positions.clear()
+        self.strokes.clear()
+        for series in self.STROKE_SERIES.values():
+            getattr(self, series).clear()
+        with self.click_lock:
+            self.click_count = 0
+            self.first_click_time = self.last_click_time = 0
+            self.click_button.clear()
         logger.debug("All data cleared")
 
+    def event_count(self) -> int:
+        """Number of mouse events captured since the last clear"""
+        return self.move_dx.count + self.scroll_dy.count + self.click_count
+
+    def get_checkpoint_state(self) -> dict:
+        """Fixed-size state saved with each journal checkpoint"""
+        with self.click_lock:
+            return {
+                "click_button": dict(self.click_button),
+                "click_count": self.click_count,
+                "first_click_time": self.first_click_time,
+                "last_click_time": self.last_click_time,
+            }
+
+    def load_checkpoint(self, series: dict, state: dict):
+        """Restore accumulators replayed from the session journal"""
+        for field in self.CHECKPOINT_SERIES:
+            for delta in series.get(field, []):
+                getattr(self, field).apply_delta(delta)
+        self.click_button.update(state.get("click_button", {}))
+        self.click_count = state.get("click_count", 0)
+        self.first_click_time = state.get("first_click_time", 0)
+        self.last_click_time = state.get("last_click_time", 0)
+
     def _update_move_stats(self, last_move_x: float, last_move_y: float,
                            new_move_dx: float, new_move_dy: float):
         """Update movement statistics"""
@@ -72,8 +152,18 @@ class MouseCapture:
         self.move_dx.append(new_move_dx)
         self.move_dy.append(new_move_dy)
 
-    def _on_move(self, x: float, y: float):
-        """Handle mouse movement events"""
+    def _on_move(self, x: float, y: float, t: Optional[float] = None):
+        """Handle mouse movement events (``t``: event time when dispatched from the hook process)"""
+        self.last_event_time = t or time.time()
+        if self.move_interval and self.last_event_time - self.last_move_time < self.move_interval:
+            return
+        self.last_move_time = self.last_event_time
+        if self.raw_sink is not None:
+            self.raw_sink.append(self.last_event_time, KIND_MOVE, 0, x, y)
+        self.strokes.add_move(self.last_event_time, x, y)
+        if self.last_move_x is None:
+            self.last_move_x, self.last_move_y = x, y
+            return
         local_dx = abs(x - self.last_move_x)
         local_dy = abs(y - self.last_move_y)
 
@@ -87,8 +177,11 @@ class MouseCapture:
         self.temp_scroll = 0
         self.is_scrolling = False
 
-    def _on_scroll(self, _x: float, _y: float, _dx: float, _dy: float):
-        """Handle mouse scroll events"""
+    def _on_scroll(self, _x: float, _y: float, _dx: float, _dy: float, t: Optional[float] = None):
+        """Handle mouse scroll events (``t``: event time when dispatched from the hook process)"""
+        self.last_event_time = t or time.time()
+        if self.raw_sink is not None:
+            self.raw_sink.append(self.last_event_time, KIND_SCROLL, 0, _dx, _dy)
         if not self.is_scrolling and self.temp_scroll == 0:
             logger.debug("Scroll event detected")
             self.is_scrolling = True
@@ -97,65 +190,95 @@ class MouseCapture:
 
         self.temp_scroll += 1
 
-    def _on_click(self, x: float, y: float, button: mouse.Button, pressed: bool):
-        """Handle mouse click events"""
+    def _on_click(self, x: float, y: float, button: mouse.Button, pressed: bool, t: Optional[float] = None):
+        """Handle mouse click events (``t``: event time when dispatched from the hook process)"""
+        current_time = t or time.time()
+        if self.raw_sink is not None:
+            self.raw_sink.append(current_time, KIND_CLICK_DOWN if pressed else KIND_CLICK_UP,
+                                 BUTTON_CODES.get(getattr(button, "name", ""), 0), x, y)
         if pressed:
-            current_time = time.time()
-            self.click_times.append(current_time)
-            self.click_positions.append((x, y))
-
+            self.last_event_time = current_time
             button_name = str(button)
+            with self.click_lock:
+                if self.click_count:
+                    self.click_intervals.append(current_time - self.last_click_time)
+                else:
+                    self.first_click_time = current_time
+                self.click_count += 1
+                self.last_click_time = current_time
+
+                if  self.click_button.get(button_name):
+                    self.click_button[button_name] += 1
+                else:
+                    self.click_button[button_name] = 1
+            self.click_positions.append((x, y))
+            self.strokes.add_click(current_time)
 
-            if  self.click_button.get(button_name):
-                self.click_button[button_name] += 1
-            else:
-                self.click_button[button_name] = 1
-
-            logger.debug(f"Click: {button} at ({x}, {y})")
+            logger.debug("Click: %s at (%s, %s)", button, x, y)
 
+    def _on_strokes(self, features: Dict[str, np.ndarray]):
+        """Sample the features of a batch of completed strokes (undefined values are skipped)"""
+        for feature, series in self.STROKE_SERIES.items():
+            values = features[feature]
+            getattr(self, series).extend(values[np.isfinite(values)].tolist())
 
     # Statistic methods
 
     def _get_movement_stats(self) -> dict:
         """Get statistics about mouse movement"""
         return {
-            "total_movements": len(self.move_dx) or 0,
-            "avg_dx": statistics.mean(self.move_dx) if self.move_dx else 0,
-            "avg_dy": statistics.mean(self.move_dy) if self.move_dy else 0,
-            "max_dx": max(self.move_dx) if self.move_dx else 0,
-            "max_dy": max(self.move_dy) if self.move_dy else 0,
-            "total_distance": (sum(self.move_dx) + sum(self.move_dy)) or 0
+            "total_movements": self.move_dx.count,
+            "avg_dx": self.move_dx.mean,
+            "avg_dy": self.move_dy.mean,
+            "max_dx": self.move_dx.max if self.move_dx else 0,
+            "max_dy": self.move_dy.max if self.move_dy else 0,
+            "total_distance": self.move_dx.total + self.move_dy.total,
+            "sampling_rate": round(self.move_dx.sampling_rate, 4),
         }
 
     def _get_scroll_stats(self) -> dict:
         """Get statistics about mouse scrolling"""
 
+        # Scroll bursts are counted in ticks and always positive, so the total is the distance
         return {
-            "total_scrolls": len(self.scroll_dy) or 0,
-            "total_scroll_distance": sum(abs(y) for y in self.scroll_dy) or 0,
-            "avg_scroll_distance": statistics.mean(self.scroll_dy or [0]) ,
+            "total_scrolls": self.scroll_dy.count,
+            "total_scroll_distance": self.scroll_dy.total,
+            "avg_scroll_distance": self.scroll_dy.mean,
+            "sampling_rate": round(self.scroll_dy.sampling_rate, 4),
         }
 
     def _get_click_stats(self) -> dict:
         """Get statistics about mouse clicks"""
 
-        click_intervals = []
-        for i in range(1, len(self.click_times)):
-            interval = self.click_times[i] - self.click_times[i - 1]
-            click_intervals.append(interval)
+        click_span = self.last_click_time - self.first_click_time
 
         return {
-            "total_clicks": len(self.click_times) or 0,
-            "avg_click_interval": statistics.mean(click_intervals) if click_intervals else 0,
-            "clicks_per_minute": len(self.click_times) / ((self.click_times[-1] - self.click_times[0]) / 60)
-            if len(self.click_times) > 1 else 0,
-            "clicks_per_button": self.click_button
+            "total_clicks": self.click_count,
+            "avg_click_interval": self.click_intervals.mean,
+            "clicks_per_minute": self.click_count / (click_span / 60)
+            if self.click_count > 1 and click_span > 0 else 0,
+            "clicks_per_button": self.click_button,
+            "sampling_rate": round(self.click_intervals.sampling_rate, 4),
         }
 
+    def end_strokes(self):
+        """Complete the stroke in progress, called when the session ends"""
+        self.strokes.process(final=True)
+
+    def _get_stroke_stats(self) -> dict:
+        """Get per-stroke trajectory statistics, None when no stroke had the feature"""
+        stats = {"stroke_count": self.stroke_duration.count}
+        for feature, column in SUMMARY_COLUMNS.items():
+            series = getattr(self, self.STROKE_SERIES[feature])
+            stats[column] = series.mean if series else None
+        stats["sampling_rate"] = round(self.stroke_duration.sampling_rate, 4)
+        return stats
+
     def get_summary(self) -> dict:
         """Get a summary of all captured data"""
         return {
             "movement": self._get_movement_stats(),
             "scroll": self._get_scroll_stats(),
-            "click": self._get_click_stats()
+            "click": self._get_click_stats(),
+            "strokes": self._get_stroke_stats(),
         }
\ No newline at end of file
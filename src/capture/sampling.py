@@ -0,0 +1,156 @@
+from __future__ import annotations
+from array import array
+from typing import Optional
+import math, random, threading
+
+# Approximate bytes held per retained sample, used to turn a memory budget into capacities
+SAMPLE_BYTES = {"d": 8, None: 72}
+
+
+class Reservoir:
+    """
+    Uniform sample of at most ``capacity`` items from an unbounded stream
+    (reservoir sampling, Algorithm R). ``count`` stays exact.
+
+    Replaced slots are marked in a bitmap until the next ``state_delta`` so the
+    session journal can write incremental checkpoints; their values are read
+    from ``samples`` at delta time. The bitmap costs one bit per slot.
+    Appends and ``state_delta`` share a lock, as the journal takes deltas from
+    its own thread while capture threads keep appending.
+    """
+    def __init__(self, capacity: int, typecode: Optional[str] = "d", seed: Optional[int] = None):
+        self.capacity = max(int(capacity), 1)
+        self.typecode = typecode
+        self.samples = array(typecode) if typecode else []
+        self.count: int = 0
+        self.dirty = bytearray((self.capacity + 7) // 8)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def append(self, value):
+        with self.lock:
+            self._append(value)
+
+    def _append(self, value):
+        self.count += 1
+        if len(self.samples) < self.capacity:
+            self.samples.append(value)
+        else:
+            slot = self.random.randrange(self.count)
+            if slot < self.capacity:
+                self.samples[slot] = value
+                self.dirty[slot >> 3] |= 1 << (slot & 7)
+
+    def extend(self, values):
+        with self.lock:
+            for value in values:
+                self._append(value)
+
+    def clear(self):
+        with self.lock:
+            self._clear()
+
+    def _clear(self):
+        del self.samples[:]
+        self.count = 0
+        self.dirty = bytearray(len(self.dirty))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __bool__(self) -> bool:
+        return self.count > 0
+
+    @property
+    def sampling_rate(self) -> float:
+        """Fraction of the observed items that are retained"""
+        return len(self.samples) / self.count if self.count else 1.0
+
+    def _state(self) -> dict:
+        return {"count": self.count}
+
+    def state_delta(self, cursor: int) -> tuple[dict, int]:
+        """
+        Changes since the previous call for the session journal
+        :param cursor: number of samples already journaled
+        :return: (delta, new cursor)
+        """
+        with self.lock:
+            end = len(self.samples)
+            replaced = {
+                slot: self.samples[slot]
+                for i, bits in enumerate(self.dirty) if bits
+                for slot in range(i * 8, i * 8 + 8) if bits >> (slot & 7) & 1
+            }
+            delta = {**self._state(), "append": list(self.samples[cursor:end]), "set": replaced}
+            self.dirty = bytearray(len(self.dirty))
+        return delta, end
+
+    def apply_delta(self, delta: dict):
+        """Replay a ``state_delta`` output (JSON round-tripped)"""
+        if self.typecode:
+            self.samples.extend(delta["append"])
+        else:
+            self.samples.extend(tuple(v) if isinstance(v, list) else v for v in delta["append"])
+        for slot, value in delta["set"].items():
+            if int(slot) < len(self.samples):
+                self.samples[int(slot)] = tuple(value) if isinstance(value, list) else value
+        self.count = delta["count"]
+
+
+class SampledSeries(Reservoir):
+    """
+    Numeric ``Reservoir`` that also keeps exact count, total, mean, variance
+    (Welford), min and max over every value, sampled or not.
+    """
+    def __init__(self, capacity: int, seed: Optional[int] = None):
+        super().__init__(capacity, "d", seed)
+        self.total: float = 0.0
+        self.mean: float = 0.0
+        self.m2: float = 0.0
+        self.min: float = math.inf
+        self.max: float = -math.inf
+
+    def _append(self, value: float):
+        super()._append(value)
+        self.total += value
+        diff = value - self.mean
+        self.mean += diff / self.count
+        self.m2 += diff * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def _clear(self):
+        super()._clear()
+        self.total = self.mean = self.m2 = 0.0
+        self.min, self.max = math.inf, -math.inf
+
+    @property
+    def stdev(self) -> float:
+        """Sample standard deviation"""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def median(self) -> float:
+        """Median of the retained samples (exact until sampling starts)"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        mid = len(ordered) // 2
+        return ordered[mid] if len(ordered) % 2 else (ordered[mid - 1] + ordered[mid]) / 2
+
+    def _state(self) -> dict:
+        return {"count": self.count, "total": self.total, "mean": self.mean, "m2": self.m2,
+                "min": self.min if self.count else None, "max": self.max if self.count else None}
+
+    def apply_delta(self, delta: dict):
+        super().apply_delta(delta)
+        self.total, self.mean, self.m2 = delta["total"], delta["mean"], delta["m2"]
+        self.min = delta["min"] if delta["min"] is not None else math.inf
+        self.max = delta["max"] if delta["max"] is not None else -math.inf
+
+
+def capacity_for(budget_bytes: int, typecodes: list) -> int:
+    """Per-series capacity so that ``typecodes`` series together stay within ``budget_bytes``"""
+    return max(int(budget_bytes // sum(SAMPLE_BYTES[t] for t in typecodes)), 1)
@@ -0,0 +1,74 @@
+from __future__ import annotations
+from typing import Callable, Iterator, Optional
+import math, random, time
+
+from src.utils.events import KIND_KEY_DOWN, KIND_KEY_UP, KIND_MOVE, KIND_CLICK_DOWN, KIND_CLICK_UP, KIND_SCROLL
+
+# (t, kind, flags, code, x, y)
+Event = tuple
+
+
+class SyntheticEventDriver:
+    """
+    Headless source of plausible input events for benchmarks and tests:
+    mostly pointer moves along curved paths, with key presses, clicks and
+    scrolls mixed in. No input hooks or display are needed.
+    """
+    def __init__(self, rate: float = 1000, seed: Optional[int] = 0):
+        self.rate = rate
+        self.random = random.Random(seed)
+        self.x, self.y = 960.0, 540.0
+        self.heading = 0.0
+
+    def _next(self, t: float) -> list[Event]:
+        r = self.random.random()
+        if r < 0.85:
+            self.heading += self.random.gauss(0, 0.2)
+            step = self.random.uniform(1, 8)
+            self.x = min(max(self.x + step * math.cos(self.heading), 0), 1919)
+            self.y = min(max(self.y + step * math.sin(self.heading), 0), 1079)
+            return [(t, KIND_MOVE, 0, 0, int(self.x), int(self.y))]
+        if r < 0.95:
+            code = self.random.randrange(97, 123)
+            return [(t, KIND_KEY_DOWN, 0, code, 0, 0), (t + self.random.uniform(0.05, 0.15), KIND_KEY_UP, 0, code, 0, 0)]
+        if r < 0.99:
+            return [(t, KIND_CLICK_DOWN, 1, 1, int(self.x), int(self.y)),
+                    (t + self.random.uniform(0.06, 0.12), KIND_CLICK_UP, 0, 1, int(self.x), int(self.y))]
+        return [(t, KIND_SCROLL, 0, 0, 0, self.random.choice((-1, 1)))]
+
+    def events(self, n: int, start: Optional[float] = None) -> Iterator[Event]:
+        """Generate ``n`` events with timestamps spaced at ``rate``, without waiting"""
+        t = start if start is not None else time.time()
+        emitted = 0
+        while emitted < n:
+            for event in self._next(t):
+                yield event
+                emitted += 1
+            t += 1 / self.rate
+
+    def run(self, sink: Callable[[Event], None], duration: float,
+            on_late: Optional[Callable[[float], None]] = None) -> int:
+        """
+        Feed events to ``sink`` in real time for ``duration`` seconds
+        :param sink: called with each event
+        :param on_late: called after each event with its lateness (seconds after its scheduled time)
+        :return: number of events emitted
+        """
+        interval = 1 / self.rate
+        start = time.perf_counter()
+        wall_start = time.time()
+        emitted = 0
+        pending: list[Event] = []
+        while True:
+            scheduled = start + emitted * interval
+            now = time.perf_counter()
+            if scheduled - start >= duration:
+                return emitted
+            if scheduled > now:
+                time.sleep(scheduled - now)
+            if not pending:
+                pending = self._next(wall_start + (scheduled - start))
+            sink(pending.pop(0))
+            if on_late is not None:
+                on_late(time.perf_counter() - scheduled)
+            emitted += 1
@@ -1,6 +1,7 @@
 import threading
 import time
 import sys
+import signal
 import subprocess
 import platform
 
@@ -13,13 +14,19 @@ class WindowCapture:
         self.current_context = None
         self.session_start = None
 
-    def run(self, on_window_change):
+    def run(self, on_window_change, on_tick=None, on_stop=None):
         """
         on_window_change: function that takes one argument (context string)
+        on_tick: optional function called after every poll
+        on_stop: optional function called on Ctrl+C / SIGTERM instead of a last on_window_change
         """
         self.running = True
         prev_context = None
 
+        # Treat service stop (SIGTERM) like Ctrl+C so the session is closed cleanly
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self._on_terminate)
+
         try:
             while self.running:
                 active_window = self.get_active_window()
@@ -28,17 +35,26 @@ class WindowCapture:
                 if context != prev_context:
                     prev_context = context
                     on_window_change(context)
+                if on_tick is not None:
+                    on_tick()
 
                 time.sleep(self.window_poll_interval)
         except KeyboardInterrupt:
             print("\n[!] Stopping capture...")
-            active_window = self.get_active_window()
-            context = f"{active_window}"
+            if on_stop is not None:
+                on_stop()
+            else:
+                active_window = self.get_active_window()
+                context = f"{active_window}"
 
-            on_window_change(context)
+                on_window_change(context)
 
             sys.exit(0)
 
+    @staticmethod
+    def _on_terminate(_signum, _frame):
+        raise KeyboardInterrupt
+
     @staticmethod
     def get_active_window():
         system = platform.system()
@@ -0,0 +1,119 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_right
+from typing import Dict, Optional, Tuple
+import math
+
+# Upper bin edges per aggregated column. The first bin collects values up to
+# the first edge, the last bin everything above the last edge. Every column has
+# the same number of bins so histograms can be stored and merged uniformly.
+COLUMN_BIN_EDGES: Dict[str, Dict[str, Tuple[float, ...]]] = {
+    "keyboard_data": {
+        "avg_cpm": (0, 25, 50, 75, 100, 125, 150, 175, 200, 250, 300, 350, 400, 500, 650),
+        "median_cpm": (0, 25, 50, 75, 100, 125, 150, 175, 200, 250, 300, 350, 400, 500, 650),
+        "avg_hold_time": (0, 0.04, 0.06, 0.08, 0.1, 0.12, 0.14, 0.16, 0.19, 0.23, 0.28, 0.35, 0.5, 0.75, 1.0),
+        "shortcut_count": (0, 1, 2, 3, 5, 8, 12, 20, 30, 50, 80, 120, 200, 300, 500),
+        "keystroke_count": (0, 10, 25, 50, 100, 200, 350, 500, 750, 1000, 1500, 2500, 4000, 6000, 10000),
+    },
+    "mouse_data": {
+        "avg_dx": (0, 1, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 30, 50, 100),
+        "avg_dy": (0, 1, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 30, 50, 100),
+        "avg_scroll_distance": (0, 1, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 30, 50, 100),
+        "avg_click_interval": (0, 0.25, 0.5, 1, 1.5, 2, 3, 4, 6, 8, 12, 20, 30, 60, 120),
+        "clicks_per_minute": (0, 1, 2, 4, 6, 8, 10, 15, 20, 30, 40, 60, 80, 120, 200),
+        "avg_stroke_duration": (0, 0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0, 1.3, 1.7, 2.5, 4),
+        "avg_straightness": (0, 0.3, 0.4, 0.5, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.88, 0.91, 0.94, 0.97, 0.99),
+        "avg_curvature": (0, 0.002, 0.005, 0.01, 0.015, 0.02, 0.03, 0.04, 0.05, 0.07, 0.1, 0.15, 0.2, 0.3, 0.5),
+        "avg_stroke_velocity": (0, 100, 200, 300, 400, 500, 650, 800, 1000, 1250, 1500, 2000, 2500, 3500, 5000),
+        "avg_peak_velocity_time": (0, 0.1, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5, 0.55, 0.6, 0.65, 0.7, 0.8, 0.9),
+        "avg_acceleration": (0, 1e3, 2.5e3, 5e3, 7.5e3, 1e4, 1.5e4, 2e4, 3e4, 4e4, 6e4, 8e4, 1.2e5, 2e5, 4e5),
+        "avg_overshoot": (0, 0.005, 0.01, 0.02, 0.03, 0.05, 0.07, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1, 2),
+        "avg_click_to_target": (0, 0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+    },
+}
+N_BINS = 16
+assert all(len(edges) + 1 == N_BINS for cols in COLUMN_BIN_EDGES.values() for edges in cols.values())
+
+
+class ColumnAggregate:
+    """
+    Mergeable summary of one numeric column: count, sum, sum of squares,
+    min, max and a fixed-bin histogram (bin edges from ``COLUMN_BIN_EDGES``).
+    """
+    def __init__(self, edges: Tuple[float, ...], n: int = 0, total: float = 0.0, total_sq: float = 0.0,
+                 min_value: Optional[float] = None, max_value: Optional[float] = None,
+                 hist: Optional[array] = None):
+        self.edges = edges
+        self.n = n
+        self.total = total
+        self.total_sq = total_sq
+        self.min = min_value
+        self.max = max_value
+        self.hist = hist if hist is not None else array("I", [0] * N_BINS)
+
+    def add(self, value: float) -> None:
+        self.n += 1
+        self.total += value
+        self.total_sq += value * value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.hist[bisect_right(self.edges, value)] += 1
+
+    def merge(self, other: "ColumnAggregate") -> None:
+        self.n += other.n
+        self.total += other.total
+        self.total_sq += other.total_sq
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        for i, count in enumerate(other.hist):
+            self.hist[i] += count
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.n if self.n else 0.0
+
+    @property
+    def variance(self) -> float:
+        """Sample variance from the running sums"""
+        if self.n < 2:
+            return 0.0
+        return max((self.total_sq - self.total * self.total / self.n) / (self.n - 1), 0.0)
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile, interpolated linearly inside the histogram bin"""
+        if not self.n:
+            return 0.0
+        rank = q * self.n
+        seen = 0
+        for i, count in enumerate(self.hist):
+            if count and seen + count >= rank:
+                low = self.edges[i - 1] if i > 0 else self.min
+                high = self.edges[i] if i < len(self.edges) else self.max
+                low, high = max(low, self.min), min(high, self.max)
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def hist_bytes(self) -> bytes:
+        return self.hist.tobytes()
+
+    @classmethod
+    def from_row(cls, edges: Tuple[float, ...], n: int, total: float, total_sq: float,
+                 min_value: Optional[float], max_value: Optional[float], hist: bytes) -> "ColumnAggregate":
+        counts = array("I")
+        counts.frombytes(hist)
+        return cls(edges, n, total, total_sq, min_value, max_value, counts)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.n,
+            "mean": self.mean,
+            "std": math.sqrt(self.variance),
+            "min": self.min,
+            "max": self.max,
+            "p10": self.quantile(0.1),
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "hist": list(self.hist),
+        }
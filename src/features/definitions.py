@@ -0,0 +1,193 @@
+from __future__ import annotations
+from typing import Callable, Dict, Optional
+import numpy as np
+
+from src.features.keystroke_timing import BIN_CENTERS, KEY_CLASS_NAMES, N_BINS, N_CLASSES
+from src.features.strokes import SUMMARY_COLUMNS, segment_strokes, stroke_features
+from src.utils.events import KIND_KEY_DOWN, KIND_MOVE, KIND_CLICK_DOWN
+from src.utils.segment_log import RECORD_DTYPE
+
+# Stored columns read by the definitions. Listed explicitly: versions must not change
+# when columns are added to the tables.
+KB_COLUMNS = ("avg_cpm", "median_cpm", "avg_hold_time", "shortcut_count", "keystroke_count")
+V1_MOUSE_COLUMNS = ("avg_dx", "avg_dy", "avg_scroll_distance", "avg_click_interval", "clicks_per_minute")
+STROKE_COLUMNS = ("stroke_count", *SUMMARY_COLUMNS.values())
+MOUSE_COLUMNS = V1_MOUSE_COLUMNS + STROKE_COLUMNS
+
+
+class SessionBatch:
+    """
+    Inputs of a batch of sessions as arrays aligned on ``session_ids``, so
+    feature definitions are computed for the whole batch at once.
+
+    ``events`` holds the raw events of all sessions back to back (empty when
+    raw events were not recorded); ``offsets[i]:offsets[i + 1]`` are session i's.
+    """
+    def __init__(self, session_ids: list[str], durations: np.ndarray, kb: np.ndarray, mouse: np.ndarray,
+                 dwell: np.ndarray, flight: np.ndarray, events: Optional[np.ndarray] = None,
+                 offsets: Optional[np.ndarray] = None):
+        self.session_ids = session_ids
+        self.durations = durations      # (n,) seconds
+        self.kb = kb                    # (n, len(KB_COLUMNS)), NaN when missing
+        self.mouse = mouse              # (n, len(MOUSE_COLUMNS)), NaN when missing
+        self.dwell = dwell              # (n, N_CLASSES * N_CLASSES * N_BINS) counts, zeros when missing
+        self.flight = flight
+        self.events = events if events is not None else np.empty(0, RECORD_DTYPE)
+        self.offsets = offsets if offsets is not None else np.zeros(len(session_ids) + 1, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.session_ids)
+
+    def event_session(self) -> np.ndarray:
+        """Batch row of every raw event"""
+        return np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+
+def _safe_div(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(den > 0, num / np.where(den > 0, den, 1), np.nan)
+
+
+def _timing_means(counts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Mean duration overall and per leading key class from digraph histograms"""
+    hist = counts.reshape(len(counts), N_CLASSES, N_CLASSES, N_BINS).astype(np.float64)
+    centers = np.asarray(BIN_CENTERS)
+    by_class = hist.sum(axis=2)                              # (n, C, B)
+    per_class = _safe_div((by_class * centers).sum(-1), by_class.sum(-1))
+    overall = by_class.sum(axis=1)                           # (n, B)
+    return _safe_div((overall * centers).sum(-1), overall.sum(-1)), per_class
+
+
+def features_v1(batch: SessionBatch) -> Dict[str, np.ndarray]:
+    """The per-session summary columns written by the capture service"""
+    features = {"duration": batch.durations}
+    features.update({column: batch.kb[:, i] for i, column in enumerate(KB_COLUMNS)})
+    features.update({column: batch.mouse[:, i] for i, column in enumerate(V1_MOUSE_COLUMNS)})
+    return features
+
+
+def features_v2(batch: SessionBatch) -> Dict[str, np.ndarray]:
+    """v1 plus keystroke timing summaries and, when raw events exist, event rates and pointer kinematics"""
+    features = features_v1(batch)
+
+    dwell, dwell_by_class = _timing_means(batch.dwell)
+    flight, _ = _timing_means(batch.flight)
+    features["dwell_mean"] = dwell
+    features["flight_mean"] = flight
+    for i, name in enumerate(KEY_CLASS_NAMES):
+        features[f"dwell_mean_{name}"] = dwell_by_class[:, i]
+
+    n = len(batch)
+    events = batch.events
+    row = batch.event_session()
+    has_raw = np.diff(batch.offsets) > 0
+    kind = events["kind"]
+
+    def count(mask: np.ndarray) -> np.ndarray:
+        return np.bincount(row[mask], minlength=n).astype(np.float64)
+
+    span = np.zeros(n)
+    if len(events):
+        t = events["t"]
+        starts, ends = batch.offsets[:-1][has_raw], batch.offsets[1:][has_raw] - 1
+        span[has_raw] = t[ends] - t[starts]
+
+    moves = kind == KIND_MOVE
+    move_rows = row[moves]
+    x = events["x"][moves].astype(np.float64)
+    y = events["y"][moves].astype(np.float64)
+    t_moves = events["t"][moves]
+    # Steps between consecutive moves of the same session
+    same = move_rows[1:] == move_rows[:-1]
+    step = np.hypot(np.diff(x), np.diff(y))[same]
+    step_dt = np.diff(t_moves)[same]
+    step_rows = move_rows[1:][same]
+    path = np.bincount(step_rows, weights=step, minlength=n)
+    moving_time = np.bincount(step_rows, weights=np.minimum(step_dt, 0.25), minlength=n)
+
+    # Straight-line distance between the first and last move of each session
+    first = np.full(n, len(move_rows))
+    last = np.full(n, -1)
+    idx = np.arange(len(move_rows))
+    np.minimum.at(first, move_rows, idx)
+    np.maximum.at(last, move_rows, idx)
+    has_moves = last >= 0
+    displacement = np.zeros(n)
+    displacement[has_moves] = np.hypot(x[last[has_moves]] - x[first[has_moves]], y[last[has_moves]] - y[first[has_moves]])
+
+    minutes = span / 60
+    raw = {
+        "move_events_per_min": _safe_div(count(moves), minutes),
+        "key_presses_per_min": _safe_div(count(kind == KIND_KEY_DOWN), minutes),
+        "clicks_per_min_raw": _safe_div(count(kind == KIND_CLICK_DOWN), minutes),
+        "path_length": path,
+        "pointer_speed": _safe_div(path, moving_time),
+        "path_straightness": _safe_div(displacement, path),
+    }
+    for name, values in raw.items():
+        features[name] = np.where(has_raw, values, np.nan)
+    return features
+
+
+def features_v3(batch: SessionBatch) -> Dict[str, np.ndarray]:
+    """v2 plus the stored per-session stroke means and, when raw events exist, the same recomputed from them"""
+    features = features_v2(batch)
+    for column in STROKE_COLUMNS:
+        features[column] = batch.mouse[:, MOUSE_COLUMNS.index(column)]
+
+    n = len(batch)
+    events = batch.events
+    row = batch.event_session()
+    has_raw = np.diff(batch.offsets) > 0
+    kind = events["kind"]
+    t = events["t"].astype(np.float64)
+
+    # Rebase every session on its own time line, one session after another with a gap
+    # wider than any pause: strokes and target clicks never cross sessions
+    first_t = np.zeros(n)
+    span = np.zeros(n)
+    if len(events):
+        starts, ends = batch.offsets[:-1][has_raw], batch.offsets[1:][has_raw] - 1
+        first_t[has_raw] = t[starts]
+        span[has_raw] = t[ends] - t[starts]
+    gap = span.max(initial=0) + 60
+    t = t - first_t[row] + row * gap
+
+    moves = kind == KIND_MOVE
+    move_rows = row[moves]
+    clicks = np.sort(t[kind == KIND_CLICK_DOWN])
+    stroke_starts, stroke_ends = segment_strokes(t[moves], clicks)
+    strokes = stroke_features(t[moves], events["x"][moves], events["y"][moves], stroke_starts, stroke_ends, clicks)
+    stroke_rows = move_rows[strokes["start"]]
+
+    features["raw_strokes_per_min"] = np.where(
+        has_raw, _safe_div(np.bincount(stroke_rows, minlength=n).astype(np.float64), span / 60), np.nan
+    )
+    for feature, column in SUMMARY_COLUMNS.items():
+        values = strokes[feature]
+        defined = np.isfinite(values)
+        total = np.bincount(stroke_rows[defined], weights=values[defined], minlength=n)
+        count = np.bincount(stroke_rows[defined], minlength=n)
+        features[f"raw_{column}"] = _safe_div(total, count)
+    return features
+
+
+# Versioned feature definitions. Existing versions must never change: add a new
+# version instead, so features already computed stay comparable.
+FEATURE_VERSIONS: Dict[int, Callable[[SessionBatch], Dict[str, np.ndarray]]] = {
+    1: features_v1,
+    2: features_v2,
+    3: features_v3,
+}
+CURRENT_VERSION = max(FEATURE_VERSIONS)
+
+
+def compute(batch: SessionBatch, version: int = CURRENT_VERSION) -> list[dict]:
+    """Per-session feature dicts of a batch, NaN reported as None"""
+    columns = FEATURE_VERSIONS[version](batch)
+    names = list(columns)
+    matrix = np.column_stack([np.asarray(columns[name], dtype=np.float64) for name in names]) if names else np.empty((len(batch), 0))
+    return [
+        {name: (None if np.isnan(value) else float(value)) for name, value in zip(names, values)}
+        for values in matrix
+    ]
@@ -0,0 +1,164 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_right
+from typing import Dict, Optional
+import string
+
+# Key classes. Only the class of a key is ever recorded, never its identity,
+# so the timing model cannot be used to reconstruct typed text.
+LEFT_LETTER = 0
+RIGHT_LETTER = 1
+DIGIT = 2
+PUNCTUATION = 3
+SPACE = 4
+ENTER = 5
+EDIT = 6
+MODIFIER = 7
+NAVIGATION = 8
+OTHER = 9
+
+KEY_CLASS_NAMES = (
+    "left", "right", "digit", "punct", "space",
+    "enter", "edit", "modifier", "nav", "other",
+)
+N_CLASSES = len(KEY_CLASS_NAMES)
+
+# Upper bin edges in seconds. Bin 0 collects negative flight times
+# (key rollover), the last bin collects everything above the last edge.
+BIN_EDGES = (
+    0.0, 0.03, 0.05, 0.07, 0.09, 0.11, 0.13, 0.15,
+    0.18, 0.22, 0.27, 0.35, 0.45, 0.6, 0.8,
+)
+N_BINS = len(BIN_EDGES) + 1
+BIN_CENTERS = tuple(
+    [BIN_EDGES[0]]
+    + [(BIN_EDGES[i - 1] + BIN_EDGES[i]) / 2 for i in range(1, len(BIN_EDGES))]
+    + [BIN_EDGES[-1]]
+)
+
+
+def _build_char_classes() -> Dict[str, int]:
+    """Precompute the char -> class interning table"""
+    table = {}
+    for c in "qwertasdfgzxcvb":
+        table[c] = table[c.upper()] = LEFT_LETTER
+    for c in "yuiophjklnm":
+        table[c] = table[c.upper()] = RIGHT_LETTER
+    for c in string.digits:
+        table[c] = DIGIT
+    for c in string.punctuation:
+        table[c] = PUNCTUATION
+    table[" "] = SPACE
+    return table
+
+
+CHAR_CLASSES: Dict[str, int] = _build_char_classes()
+
+# Special keys are looked up by their pynput ``Key`` member name
+SPECIAL_KEY_CLASSES: Dict[str, int] = {
+    "space": SPACE,
+    "enter": ENTER,
+    "tab": EDIT,
+    "backspace": EDIT,
+    "delete": EDIT,
+    "shift": MODIFIER, "shift_l": MODIFIER, "shift_r": MODIFIER,
+    "ctrl": MODIFIER, "ctrl_l": MODIFIER, "ctrl_r": MODIFIER,
+    "alt": MODIFIER, "alt_l": MODIFIER, "alt_r": MODIFIER, "alt_gr": MODIFIER,
+    "cmd": MODIFIER, "cmd_l": MODIFIER, "cmd_r": MODIFIER,
+    "caps_lock": MODIFIER,
+    "up": NAVIGATION, "down": NAVIGATION, "left": NAVIGATION, "right": NAVIGATION,
+    "home": NAVIGATION, "end": NAVIGATION, "page_up": NAVIGATION, "page_down": NAVIGATION,
+}
+
+
+def digraph(class_from: int, class_to: int) -> int:
+    """Index of the (class_from, class_to) cell"""
+    return class_from * N_CLASSES + class_to
+
+
+def key_class(key) -> int:
+    """
+    Map a pynput key object to its key class
+    :param key: ``Key`` member or ``KeyCode``
+    :return: key class index
+    """
+    char = getattr(key, "char", None)
+    if char is not None:
+        return CHAR_CLASSES.get(char, OTHER)
+    name = getattr(key, "name", None)
+    if name is not None:
+        return SPECIAL_KEY_CLASSES.get(name, OTHER)
+    return OTHER
+
+
+class TimingMatrix:
+    """
+    Fixed-size histogram of durations indexed by (class_from, class_to).
+
+    Counts live in a single preallocated ``array('I')`` of
+    N_CLASSES * N_CLASSES * N_BINS cells, so memory is constant per session
+    and ``add`` does not allocate.
+    """
+    SIZE = N_CLASSES * N_CLASSES * N_BINS
+
+    def __init__(self, counts: Optional[array] = None):
+        self.counts: array = counts if counts is not None else array("I", bytes(4 * self.SIZE))
+
+    def add(self, cell: int, seconds: float) -> None:
+        """Count one duration in a digraph cell (see ``digraph``)"""
+        self.counts[cell * N_BINS + bisect_right(BIN_EDGES, seconds)] += 1
+
+    def clear(self) -> None:
+        """Zero all cells in place"""
+        for i in range(self.SIZE):
+            self.counts[i] = 0
+
+    def total(self) -> int:
+        return sum(self.counts)
+
+    def cell(self, class_from: int, class_to: int) -> array:
+        """Histogram of a single digraph cell"""
+        start = digraph(class_from, class_to) * N_BINS
+        return self.counts[start:start + N_BINS]
+
+    def to_bytes(self) -> bytes:
+        """Serialize counts (native-endian uint32) for storage"""
+        return self.counts.tobytes()
+
+    def to_sparse(self) -> dict:
+        """Non-zero cells as ``{index: count}``, compact for JSON"""
+        return {i: c for i, c in enumerate(self.counts) if c}
+
+    def load_sparse(self, cells: dict) -> None:
+        """Overwrite counts from ``to_sparse`` output (keys may be strings after JSON)"""
+        self.clear()
+        for i, c in cells.items():
+            self.counts[int(i)] = c
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TimingMatrix":
+        counts = array("I")
+        counts.frombytes(data)
+        if len(counts) != cls.SIZE:
+            raise ValueError(f"Expected {cls.SIZE} cells, got {len(counts)}")
+        return cls(counts)
+
+    def to_features(self, prefix: str, min_count: int = 5) -> dict:
+        """
+        Flatten into model features: mean duration per digraph cell
+        :param prefix: feature name prefix (e.g. ``dwell``)
+        :param min_count: cells with fewer samples are reported as None
+        :return: dictionary of ``{prefix}_{from}_{to}`` -> mean seconds
+        """
+        features = {}
+        for i, from_name in enumerate(KEY_CLASS_NAMES):
+            for j, to_name in enumerate(KEY_CLASS_NAMES):
+                hist = self.cell(i, j)
+                n = sum(hist)
+                features[f"{prefix}_{from_name}_{to_name}"] = (
+                    sum(c * BIN_CENTERS[b] for b, c in enumerate(hist)) / n if n >= min_count else None
+                )
+        return features
+
+    def __repr__(self) -> str:
+        return f"TimingMatrix(total={self.total()})"
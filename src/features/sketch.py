@@ -0,0 +1,176 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_right
+from typing import Optional
+import math, random, struct
+
+_HEADER = struct.Struct("<HQH")  # k, n, number of levels
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang, Liberty 2016). Keeps about ``3 * k``
+    values whatever the stream length, so k=128 stays under 2 KB serialized,
+    and two sketches of the same ``k`` can be merged.
+
+    Level ``h`` holds values that each stand for ``2 ** h`` observations.
+    """
+    C = 2 / 3
+
+    def __init__(self, k: int = 128, seed: Optional[int] = None):
+        self.k = k
+        self.n = 0
+        self.levels: list[list[float]] = [[]]
+        self.size = 0
+        self.max_size = self._capacity(0)
+        self.random = random.Random(seed)
+
+    def _capacity(self, h: int) -> int:
+        depth = len(self.levels) - h - 1
+        return int(math.ceil(self.C ** depth * self.k)) + 1
+
+    def _grow(self):
+        self.levels.append([])
+        self.max_size = sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def _compress(self):
+        while self.size >= self.max_size:
+            for h, level in enumerate(self.levels):
+                if len(level) < self._capacity(h):
+                    continue
+                if h + 1 == len(self.levels):
+                    self._grow()
+                level.sort()
+                # An odd item out stays behind so that weights are preserved
+                keep = [level.pop()] if len(level) % 2 else []
+                self.levels[h + 1].extend(level[self.random.randrange(2)::2])
+                self.levels[h] = keep
+                self.size = sum(len(level) for level in self.levels)
+                break
+
+    def update(self, value: float) -> None:
+        self.levels[0].append(float(value))
+        self.n += 1
+        self.size += 1
+        if self.size >= self.max_size:
+            self._compress()
+
+    def merge(self, other: "KLLSketch") -> None:
+        while len(self.levels) < len(other.levels):
+            self._grow()
+        for h, level in enumerate(other.levels):
+            self.levels[h].extend(level)
+        self.n += other.n
+        self.size += other.size
+        self._compress()
+
+    def _weighted(self) -> tuple[list[float], list[float]]:
+        """Sorted retained values and their cumulative weights"""
+        items = sorted((value, 1 << h) for h, level in enumerate(self.levels) for value in level)
+        values, cumulative, total = [], [], 0
+        for value, weight in items:
+            total += weight
+            values.append(value)
+            cumulative.append(total)
+        return values, cumulative
+
+    def cdf(self, value: float) -> float:
+        values, cumulative = self._weighted()
+        i = bisect_right(values, value)
+        return cumulative[i - 1] / cumulative[-1] if i else 0.0
+
+    def quantile(self, q: float) -> float:
+        values, cumulative = self._weighted()
+        if not values:
+            return 0.0
+        rank = q * cumulative[-1]
+        return values[min(bisect_right(cumulative, rank), len(values) - 1)]
+
+    def ks_distance(self, other: "KLLSketch") -> float:
+        """Kolmogorov-Smirnov statistic sup |F_self - F_other| between the two sketched distributions"""
+        a_values, a_cum = self._weighted()
+        b_values, b_cum = other._weighted()
+        if not a_values or not b_values:
+            return 0.0
+        distance = 0.0
+        for x in a_values + b_values:
+            i, j = bisect_right(a_values, x), bisect_right(b_values, x)
+            fa = a_cum[i - 1] / a_cum[-1] if i else 0.0
+            fb = b_cum[j - 1] / b_cum[-1] if j else 0.0
+            distance = max(distance, abs(fa - fb))
+        return distance
+
+    def to_bytes(self) -> bytes:
+        counts = array("I", [len(level) for level in self.levels])
+        values = array("f", [value for level in self.levels for value in level])
+        return _HEADER.pack(self.k, self.n, len(self.levels)) + counts.tobytes() + values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "KLLSketch":
+        k, n, n_levels = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        counts = array("I")
+        counts.frombytes(data[offset:offset + 4 * n_levels])
+        values = array("f")
+        values.frombytes(data[offset + 4 * n_levels:])
+        sketch = cls(k)
+        sketch.n = n
+        sketch.levels, start = [], 0
+        for count in counts:
+            sketch.levels.append(values[start:start + count].tolist())
+            start += count
+        sketch.size = len(values)
+        sketch.max_size = sum(sketch._capacity(h) for h in range(n_levels))
+        return sketch
+
+
+class DecayedMoments:
+    """
+    Exponentially decayed count, mean and variance: an observation ``age``
+    seconds old weighs ``0.5 ** (age / half_life)``.
+    """
+    def __init__(self, half_life: float, weight: float = 0.0, mean: float = 0.0,
+                 m2: float = 0.0, t: float = 0.0):
+        self.half_life = half_life
+        self.weight = weight
+        self.mean = mean
+        self.m2 = m2
+        self.t = t
+
+    def _decay_to(self, t: float):
+        if t > self.t:
+            factor = 0.5 ** ((t - self.t) / self.half_life) if self.weight else 0.0
+            self.weight *= factor
+            self.m2 *= factor
+            self.t = t
+
+    def update(self, value: float, t: float) -> None:
+        self._decay_to(t)
+        self.weight += 1
+        diff = value - self.mean
+        self.mean += diff / self.weight
+        self.m2 += diff * (value - self.mean)
+
+    def merge(self, other: "DecayedMoments") -> None:
+        t = max(self.t, other.t)
+        self._decay_to(t)
+        other = DecayedMoments(other.half_life, other.weight, other.mean, other.m2, other.t)
+        other._decay_to(t)
+        weight = self.weight + other.weight
+        if not weight:
+            return
+        diff = other.mean - self.mean
+        self.mean += diff * other.weight / weight
+        self.m2 += other.m2 + diff * diff * self.weight * other.weight / weight
+        self.weight = weight
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.weight if self.weight else 0.0
+
+    def to_list(self) -> list[float]:
+        return [self.weight, self.mean, self.m2, self.t]
+
+    @classmethod
+    def from_list(cls, half_life: float, values: list[float]) -> "DecayedMoments":
+        return cls(half_life, *values)
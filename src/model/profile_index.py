@@ -0,0 +1,313 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional
+import numpy as np
+
+from src.features.column_stats import COLUMN_BIN_EDGES
+from src.utils.config import load_config, ensure_dirs
+from src.utils.logging import setup_logging
+from src.utils.storage import EventStore
+
+import argparse, io, math, os, time
+
+# Vector layout: every aggregated keyboard_data column, then every mouse_data column
+FEATURES = tuple((source, column) for source, columns in COLUMN_BIN_EDGES.items() for column in columns)
+DIM = len(FEATURES)
+
+# z-scores are clipped to +-CLIP and stored as int8 codes
+CLIP = 4.0
+SCALE = 127 / CLIP
+
+INDEX_FILE = "profile_index.npz"
+
+_ALIASES = {"keyboard_data": "k", "mouse_data": "m"}
+SESSION_VECTORS_SQL = f"""
+SELECT s.session_id, COALESCE(s.label, 'unlabeled'), s.created_at,
+       {", ".join(f"CAST({_ALIASES[source]}.{column} AS REAL)" for source, column in FEATURES)}
+FROM sessions s
+LEFT JOIN keyboard_data k ON k.session_id = s.session_id
+LEFT JOIN mouse_data m ON m.session_id = s.session_id
+WHERE (k.session_id IS NOT NULL OR m.session_id IS NOT NULL)
+"""
+
+
+class ProfileIndex:
+    """
+    Quantized flat index of normalized session feature vectors, used to find
+    which enrolled labels a session resembles.
+
+    Vectors are z-scored with a fixed per-column mean/std and stored as int8
+    codes in column-major order, so a query is one vectorized pass over
+    ``DIM`` contiguous int8 columns. Inserts are amortized O(1).
+    """
+    def __init__(self, mean: np.ndarray, std: np.ndarray, capacity: int = 1024):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.where(np.asarray(std, dtype=np.float64) > 0, std, 1.0)
+        self.codes = np.zeros((DIM, capacity), dtype=np.int8)
+        self.norms = np.zeros(capacity, dtype=np.int32)
+        self.label_ids = np.zeros(capacity, dtype=np.int32)
+        self.n = 0
+        self.labels: list[str] = []
+        self.label_index: dict[str, int] = {}
+        # Session id of every indexed vector, to drop the sessions purged by retention
+        self.session_ids: list[str] = []
+        # created_at of the newest indexed session, for incremental updates from the store
+        self.watermark: float = 0.0
+
+    def __len__(self) -> int:
+        return self.n
+
+    @classmethod
+    def from_store(cls, store: EventStore) -> "ProfileIndex":
+        """Empty index normalized with the overall column statistics of ``label_aggregates``"""
+        merged: dict = {}
+        for columns in store.label_summary().values():
+            for key, aggregate in columns.items():
+                if key in merged:
+                    merged[key].merge(aggregate)
+                else:
+                    merged[key] = aggregate
+        mean, std = np.zeros(DIM), np.ones(DIM)
+        for i, (source, column) in enumerate(FEATURES):
+            aggregate = merged.get(f"{source}.{column}")
+            if aggregate is not None and aggregate.n:
+                mean[i], std[i] = aggregate.mean, math.sqrt(aggregate.variance)
+        return cls(mean, std)
+
+    def quantize(self, vectors: np.ndarray) -> np.ndarray:
+        """(n, DIM) raw feature values (NaN for missing) -> (DIM, n) int8 codes"""
+        z = (np.asarray(vectors, dtype=np.float64) - self.mean) / self.std
+        z = np.nan_to_num(z, nan=0.0)
+        return np.clip(np.rint(z * SCALE), -127, 127).astype(np.int8).T
+
+    def _grow(self, needed: int):
+        capacity = self.codes.shape[1]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        codes = np.zeros((DIM, capacity), dtype=np.int8)
+        codes[:, :self.n] = self.codes[:, :self.n]
+        self.codes = codes
+        self.norms = np.resize(self.norms, capacity)
+        self.label_ids = np.resize(self.label_ids, capacity)
+
+    def add(self, vectors: np.ndarray, labels: list[str], session_ids: Optional[list[str]] = None) -> None:
+        """Insert a batch of raw feature vectors with their labels (and session ids)"""
+        codes = self.quantize(np.atleast_2d(vectors))
+        count = codes.shape[1]
+        self._grow(self.n + count)
+        end = self.n + count
+        self.codes[:, self.n:end] = codes
+        self.norms[self.n:end] = (codes.astype(np.int32) ** 2).sum(axis=0)
+        for i, label in enumerate(labels):
+            if label not in self.label_index:
+                self.label_index[label] = len(self.labels)
+                self.labels.append(label)
+            self.label_ids[self.n + i] = self.label_index[label]
+        self.session_ids += session_ids if session_ids is not None else [""] * count
+        self.n = end
+
+    def remove(self, keep: np.ndarray) -> None:
+        """Compact the index to the vectors where ``keep`` is True"""
+        kept = np.flatnonzero(keep)
+        count = len(kept)
+        self.codes[:, :count] = self.codes[:, kept]
+        self.norms[:count] = self.norms[kept]
+        self.label_ids[:count] = self.label_ids[kept]
+        self.session_ids = [self.session_ids[i] for i in kept]
+        self.n = count
+
+    def update_from_store(self, store: EventStore) -> tuple[int, int]:
+        """
+        Insert the sessions stored since the last update and drop the indexed
+        sessions no longer in the store (purged by retention)
+        :return: (sessions added, sessions removed)
+        """
+        live = {session_id for (session_id,) in store.conn.execute("SELECT session_id FROM sessions")}
+        keep = np.array([session_id in live for session_id in self.session_ids], dtype=bool)
+        removed = self.n - int(keep.sum())
+        if removed:
+            self.remove(keep)
+
+        # Sessions can share the watermark's created_at (e.g. all stamped by the same
+        # migration): re-read that instant and skip the sessions already indexed
+        indexed = set(self.session_ids)
+        rows = [
+            row for row in store.conn.execute(
+                SESSION_VECTORS_SQL + " AND s.created_at >= ? ORDER BY s.created_at", (self.watermark,)
+            )
+            if row[0] not in indexed
+        ]
+        if rows:
+            vectors = np.array([row[3:] for row in rows], dtype=np.float64)
+            self.add(vectors, [row[1] for row in rows], [row[0] for row in rows])
+            self.watermark = rows[-1][2]
+        return len(rows), removed
+
+    def distances(self, vector: np.ndarray) -> np.ndarray:
+        """Squared quantized distances (in code units) from ``vector`` to every indexed vector"""
+        query = self.quantize(np.atleast_2d(vector))[:, 0].astype(np.int32)
+        n = self.n
+        dot = np.zeros(n, dtype=np.int32)
+        for j in range(DIM):
+            if query[j]:
+                dot += self.codes[j, :n] * query[j]
+        return self.norms[:n] - 2 * dot + int((query ** 2).sum())
+
+    def query(self, vector: np.ndarray, k: int = 3) -> list[tuple[str, float]]:
+        """
+        Labels closest to a raw feature vector
+        :return: up to ``k`` (label, distance) pairs, nearest first; the distance
+                 is the Euclidean z-score distance to that label's nearest vector
+        """
+        if not self.n:
+            return []
+        unset = np.iinfo(np.int32).max
+        best = np.full(len(self.labels), unset, dtype=np.int32)
+        np.minimum.at(best, self.label_ids[:self.n], self.distances(vector))
+        # Labels whose sessions were all removed have no distance
+        order = [i for i in np.argsort(best)[:k] if best[i] != unset]
+        return [(self.labels[i], math.sqrt(max(int(best[i]), 0)) / SCALE) for i in order]
+
+    @staticmethod
+    def session_vector(store: EventStore, session_id: str) -> Optional[np.ndarray]:
+        """Raw feature vector of a stored session"""
+        row = store.conn.execute(SESSION_VECTORS_SQL + " AND s.session_id = ?", (session_id,)).fetchone()
+        return None if row is None else np.array(row[3:], dtype=np.float64)
+
+    def save(self, path: str | Path) -> None:
+        """Atomically write the index"""
+        path = Path(path)
+        buffer = io.BytesIO()
+        np.savez(
+            buffer, mean=self.mean, std=self.std, codes=self.codes[:, :self.n],
+            label_ids=self.label_ids[:self.n], labels=np.array(self.labels, dtype=str),
+            session_ids=np.array(self.session_ids, dtype=str),
+            watermark=np.array(self.watermark),
+        )
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(buffer.getvalue())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "ProfileIndex":
+        with np.load(path) as data:
+            codes = data["codes"]
+            if codes.shape[0] != DIM:
+                raise ValueError(f"{path} has {codes.shape[0]} features, expected {DIM}: rebuild the index")
+            if "session_ids" not in data:
+                raise ValueError(f"{path} has no session ids: rebuild the index")
+            index = cls(data["mean"], data["std"], capacity=max(codes.shape[1], 1024))
+            index.n = codes.shape[1]
+            index.codes[:, :index.n] = codes
+            index.norms[:index.n] = (codes.astype(np.int32) ** 2).sum(axis=0)
+            index.label_ids[:index.n] = data["label_ids"]
+            index.labels = [str(label) for label in data["labels"]]
+            index.label_index = {label: i for i, label in enumerate(index.labels)}
+            index.session_ids = [str(session_id) for session_id in data["session_ids"]]
+            index.watermark = float(data["watermark"])
+        return index
+
+
+# Benchmark
+
+def _brute_force(vectors: np.ndarray, label_ids: np.ndarray, n_labels: int, query: np.ndarray, k: int):
+    """Exact per-label nearest distance over float64 z-scored vectors"""
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    best = np.full(n_labels, np.inf)
+    np.minimum.at(best, label_ids, distances)
+    return np.argsort(best)[:k]
+
+
+def run_benchmark(sizes: list[int], n_labels: int = 50, n_queries: int = 50, k: int = 3, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in sizes:
+        centers = rng.normal(0, 1.5, (n_labels, DIM))
+        label_ids = rng.integers(0, n_labels, size)
+        vectors = centers[label_ids] + rng.normal(0, 1, (size, DIM))
+        queries = centers[rng.integers(0, n_labels, n_queries)] + rng.normal(0, 1, (n_queries, DIM))
+
+        index = ProfileIndex(np.zeros(DIM), np.ones(DIM))
+        start = time.perf_counter()
+        index.add(vectors, [str(i) for i in label_ids])
+        insert_s = time.perf_counter() - start
+        # Label ids in the index follow first appearance, map the brute-force ids to them
+        to_index = np.array([index.label_index[str(i)] for i in range(n_labels)])
+
+        brute_ms, index_ms, agree = [], [], 0
+        for query in queries:
+            start = time.perf_counter()
+            expected = _brute_force(vectors, label_ids, n_labels, query, k)
+            brute_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            found = index.query(query, k)
+            index_ms.append((time.perf_counter() - start) * 1000)
+            agree += index.labels[to_index[expected[0]]] == found[0][0]
+
+        results.append({
+            "vectors": size,
+            "insert_s": round(insert_s, 3),
+            "brute_ms": round(float(np.median(brute_ms)), 2),
+            "index_ms": round(float(np.median(index_ms)), 2),
+            "top1_agreement": round(agree / n_queries, 3),
+            "index_mb": round((index.codes[:, :size].nbytes + size * 8) / 2 ** 20, 1),
+            "brute_mb": round(vectors.nbytes / 2 ** 20, 1),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nearest-profile index over session feature vectors")
+    parser.add_argument("--config", default="config.yaml", help="Configuration file path")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from the DB")
+    parser.add_argument("--session", help="Print the labels nearest to this stored session")
+    parser.add_argument("-k", type=int, default=3, help="Number of labels returned")
+    parser.add_argument("--benchmark", action="store_true", help="Compare query latency with a brute-force scan")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Benchmark index sizes")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(f"{'vectors':>10}{'insert s':>10}{'brute ms':>10}{'index ms':>10}{'top1 agree':>12}{'index MB':>10}{'brute MB':>10}")
+        for r in run_benchmark([int(size) for size in args.sizes.split(",")]):
+            print(f"{r['vectors']:>10}{r['insert_s']:>10}{r['brute_ms']:>10}{r['index_ms']:>10}"
+                  f"{r['top1_agreement']:>12}{r['index_mb']:>10}{r['brute_mb']:>10}")
+        return
+
+    cfg = load_config(args.config)
+    ensure_dirs(cfg)
+    logger = setup_logging(cfg["paths"]["logs_dir"])
+    store = EventStore(cfg["paths"]["db_path"], logger, cfg["session_label"])
+    store.create_schema()
+
+    path = Path(cfg["paths"]["models_dir"]) / INDEX_FILE
+    index = None
+    if path.exists() and not args.rebuild:
+        try:
+            index = ProfileIndex.load(path)
+        except ValueError as e:
+            logger.warning(f"{e}, rebuilding")
+    if index is None:
+        index = ProfileIndex.from_store(store)
+    added, removed = index.update_from_store(store)
+    if added or removed:
+        index.save(path)
+    logger.info(f"Profile index: {len(index)} vectors, {added} added, {removed} removed, {len(index.labels)} labels")
+
+    if args.session:
+        vector = ProfileIndex.session_vector(store, args.session)
+        if vector is None:
+            logger.error(f"No keyboard/mouse data for session {args.session}")
+        else:
+            for label, distance in index.query(vector, args.k):
+                print(f"{label}\t{distance:.3f}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
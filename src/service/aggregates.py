@@ -0,0 +1,33 @@
+from __future__ import annotations
+from src.utils.config import load_config, ensure_dirs
+from src.utils.logging import setup_logging
+from src.utils.storage import EventStore
+import argparse, json
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-label aggregates of the keyboard/mouse data")
+    parser.add_argument("--config", default="config.yaml", help="Configuration file path")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the aggregates from the stored sessions")
+    parser.add_argument("--by-context", action="store_true", help="Report every (label, context) separately")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    ensure_dirs(cfg)
+    logger = setup_logging(cfg["paths"]["logs_dir"])
+
+    store = EventStore(cfg["paths"]["db_path"], logger, cfg["session_label"])
+    store.create_schema()
+    if args.rebuild:
+        store.rebuild_aggregates()
+
+    summary = {
+        " / ".join(key) if args.by_context else key: {column: agg.to_dict() for column, agg in columns.items()}
+        for key, columns in store.label_summary(by_context=args.by_context).items()
+    }
+    print(json.dumps(summary, indent=2))
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
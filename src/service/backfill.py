@@ -0,0 +1,251 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import closing
+from pathlib import Path
+from typing import Optional
+import numpy as np
+
+from src.features.definitions import (
+    CURRENT_VERSION, FEATURE_VERSIONS, KB_COLUMNS, MOUSE_COLUMNS, SessionBatch, compute
+)
+from src.features.keystroke_timing import TimingMatrix
+from src.utils.config import load_config, ensure_dirs
+from src.utils.logging import setup_logging
+from src.utils.segment_log import RECORD_DTYPE, SegmentLog
+from src.utils.storage import EventStore
+
+import argparse, json, logging, os, sqlite3, time
+
+# Raw events are looked up this long around the session's [start, end]
+RAW_SLACK = 60
+
+
+def load_batch(conn: sqlite3.Connection, segments: Optional[SegmentLog], session_ids: list[str]) -> SessionBatch:
+    """Read everything the feature definitions need for ``session_ids``"""
+    placeholders = ", ".join("?" * len(session_ids))
+    position = {session_id: i for i, session_id in enumerate(session_ids)}
+    n = len(session_ids)
+
+    durations = np.zeros(n)
+    bounds = np.zeros((n, 2))
+    for session_id, duration, created_at, started_at, ended_at in conn.execute(
+        f"SELECT session_id, duration, created_at, started_at, ended_at FROM sessions "
+        f"WHERE session_id IN ({placeholders})", session_ids
+    ):
+        i = position[session_id]
+        durations[i] = duration or 0
+        if started_at is not None and ended_at is not None:
+            bounds[i] = started_at, ended_at
+        else:
+            # Sessions stored before their start/end were recorded: assume stored when they ended
+            bounds[i] = (created_at or 0) - durations[i], created_at or 0
+
+    def columns(table: str, names: tuple) -> np.ndarray:
+        values = np.full((n, len(names)), np.nan)
+        for session_id, *row in conn.execute(
+            f"SELECT session_id, {', '.join(f'CAST({c} AS REAL)' for c in names)} FROM {table} "
+            f"WHERE session_id IN ({placeholders})", session_ids
+        ):
+            values[position[session_id]] = [np.nan if v is None else v for v in row]
+        return values
+
+    dwell = np.zeros((n, TimingMatrix.SIZE), dtype=np.uint32)
+    flight = np.zeros((n, TimingMatrix.SIZE), dtype=np.uint32)
+    for session_id, dwell_hist, flight_hist in conn.execute(
+        f"SELECT session_id, dwell_hist, flight_hist FROM keystroke_timing WHERE session_id IN ({placeholders})",
+        session_ids,
+    ):
+        if dwell_hist and len(dwell_hist) == 4 * TimingMatrix.SIZE:
+            dwell[position[session_id]] = np.frombuffer(dwell_hist, dtype=np.uint32)
+        if flight_hist and len(flight_hist) == 4 * TimingMatrix.SIZE:
+            flight[position[session_id]] = np.frombuffer(flight_hist, dtype=np.uint32)
+
+    parts, counts = [], np.zeros(n, dtype=np.int64)
+    if segments is not None:
+        for i, session_id in enumerate(session_ids):
+            start, end = bounds[i, 0] - RAW_SLACK, bounds[i, 1] + RAW_SLACK
+            for records, _ in segments.read(start, end, session_id):
+                parts.append(np.array(records))
+                counts[i] += len(records)
+    events = np.concatenate(parts) if parts else np.empty(0, RECORD_DTYPE)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    return SessionBatch(
+        session_ids, durations, columns("keyboard_data", KB_COLUMNS), columns("mouse_data", MOUSE_COLUMNS),
+        dwell, flight, events, offsets,
+    )
+
+
+def compute_sessions(conn: sqlite3.Connection, segments: Optional[SegmentLog], version: int,
+                     session_ids: list[str]) -> list[tuple[str, int, str]]:
+    """Feature rows ``(session_id, version, features JSON)`` ready for ``EventStore.upsert_session_features``"""
+    batch = load_batch(conn, segments, session_ids)
+    return [
+        (session_id, version, json.dumps(features))
+        for session_id, features in zip(session_ids, compute(batch, version))
+    ]
+
+
+def _compute_partition(db_path: str, segments_dir: Optional[str], version: int,
+                       session_ids: list[str]) -> list[tuple[str, int, str]]:
+    """Worker process entry point: read-only connection, results are written by the parent"""
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    with closing(sqlite3.connect(uri, uri=True)) as conn:
+        segments = SegmentLog(segments_dir) if segments_dir and Path(segments_dir).exists() else None
+        return compute_sessions(conn, segments, version, session_ids)
+
+
+class Backfill:
+    """
+    Recomputes one feature version for historical sessions into ``session_features``.
+
+    Sessions without that version are split into partitions computed by a
+    process pool; each finished partition is written in one transaction
+    together with its progress in ``backfill_progress``. An interrupted job
+    resumes with the sessions still missing. Other versions are left untouched.
+    """
+    def __init__(self, cfg: dict, logger: logging.Logger, version: int = CURRENT_VERSION,
+                 workers: Optional[int] = None, partition_size: int = 500):
+        if version not in FEATURE_VERSIONS:
+            raise ValueError(f"Unknown feature version {version}, known: {sorted(FEATURE_VERSIONS)}")
+        self.db_path = cfg["paths"]["db_path"]
+        self.segments_dir = cfg["paths"].get("segments_dir")
+        self.store = EventStore(self.db_path, logger, cfg["session_label"])
+        self.store.create_schema()
+        self.logger = logger
+        self.version = version
+        self.workers = workers or max((os.cpu_count() or 2) - 1, 1)
+        self.partition_size = partition_size
+
+    def pending(self) -> list[str]:
+        """Sessions with data but no features of this version, oldest first"""
+        return [row[0] for row in self.store.conn.execute(
+            """
+            SELECT s.session_id FROM sessions s
+            WHERE (EXISTS (SELECT 1 FROM keyboard_data k WHERE k.session_id = s.session_id)
+                   OR EXISTS (SELECT 1 FROM mouse_data m WHERE m.session_id = s.session_id))
+              AND NOT EXISTS (SELECT 1 FROM session_features f
+                              WHERE f.session_id = s.session_id AND f.version = ?)
+            ORDER BY s.created_at, s.session_id
+            """,
+            (self.version,),
+        )]
+
+    def _progress(self, total: int):
+        with self.store.conn:
+            self.store.conn.execute(
+                """
+                INSERT INTO backfill_progress (version, total, done, started_at, updated_at)
+                VALUES (?, ?, 0, ?, ?)
+                ON CONFLICT(version) DO UPDATE SET
+                  total = done + excluded.total, updated_at = excluded.updated_at, finished_at = NULL
+                """,
+                (self.version, total, time.time(), time.time()),
+            )
+
+    def _write(self, rows: list[tuple[str, int, str]]):
+        with self.store.conn:
+            self.store.upsert_session_features(rows, commit=False)
+            self.store.conn.execute(
+                "UPDATE backfill_progress SET done = done + ?, updated_at = ? WHERE version = ?",
+                (len(rows), time.time(), self.version),
+            )
+
+    def run(self, force: bool = False) -> int:
+        """
+        :param force: recompute sessions that already have this version
+        :return: number of sessions written
+        """
+        if force:
+            with self.store.conn:
+                self.store.conn.execute("DELETE FROM session_features WHERE version = ?", (self.version,))
+                self.store.conn.execute("DELETE FROM backfill_progress WHERE version = ?", (self.version,))
+
+        session_ids = self.pending()
+        self._progress(len(session_ids))
+        partitions = [session_ids[i:i + self.partition_size] for i in range(0, len(session_ids), self.partition_size)]
+        self.logger.info(
+            f"Backfilling feature version {self.version}: {len(session_ids)} sessions, "
+            f"{len(partitions)} partitions, {self.workers} workers"
+        )
+
+        written = 0
+        start = time.perf_counter()
+        if self.workers == 1 or len(partitions) <= 1:
+            for partition in partitions:
+                rows = _compute_partition(self.db_path, self.segments_dir, self.version, partition)
+                self._write(rows)
+                written += len(rows)
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = [
+                    pool.submit(_compute_partition, self.db_path, self.segments_dir, self.version, partition)
+                    for partition in partitions
+                ]
+                for future in as_completed(futures):
+                    rows = future.result()
+                    self._write(rows)
+                    written += len(rows)
+                    self.logger.info(f"Backfill v{self.version}: {written}/{len(session_ids)} sessions")
+
+        with self.store.conn:
+            self.store.conn.execute(
+                "UPDATE backfill_progress SET finished_at = ? WHERE version = ?", (time.time(), self.version)
+            )
+        self.logger.info(f"Backfilled {written} sessions in {time.perf_counter() - start:.1f}s")
+        return written
+
+    def close(self):
+        self.store.close()
+
+
+def compare(store: EventStore, old: int, new: int) -> dict:
+    """Mean of every feature shared by two versions, over the sessions that have both"""
+    rows = store.conn.execute(
+        """
+        SELECT a.features, b.features FROM session_features a
+        JOIN session_features b ON b.session_id = a.session_id AND b.version = ?
+        WHERE a.version = ?
+        """,
+        (new, old),
+    ).fetchall()
+    sums: dict = {}
+    for old_json, new_json in rows:
+        old_features, new_features = json.loads(old_json), json.loads(new_json)
+        for name in old_features.keys() & new_features.keys():
+            if old_features[name] is None or new_features[name] is None:
+                continue
+            entry = sums.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += old_features[name]
+            entry[2] += new_features[name]
+    return {
+        name: {"sessions": n, f"v{old}_mean": a / n, f"v{new}_mean": b / n}
+        for name, (n, a, b) in sorted(sums.items())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute a feature version for historical sessions")
+    parser.add_argument("--config", default="config.yaml", help="Configuration file path")
+    parser.add_argument("--version", type=int, default=CURRENT_VERSION, help="Feature version to compute")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPUs - 1)")
+    parser.add_argument("--partition-size", type=int, default=500, help="Sessions per partition")
+    parser.add_argument("--force", action="store_true", help="Recompute sessions that already have this version")
+    parser.add_argument("--compare", type=int, metavar="OLD", help="Compare --version with an older version")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    ensure_dirs(cfg)
+    logger = setup_logging(cfg["paths"]["logs_dir"])
+
+    backfill = Backfill(cfg, logger, args.version, args.workers, args.partition_size)
+    if args.compare is not None:
+        print(json.dumps(compare(backfill.store, args.compare, args.version), indent=2))
+    else:
+        backfill.run(force=args.force)
+    backfill.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,82 +1,351 @@
 from src.capture.mouse_capture import MouseCapture
 from src.capture.kb_capture import KeyboardCapture
 from src.capture.window_capture import WindowCapture
+from src.capture.hook_process import HookSupervisor
 
+from src.service.checkpoint import SessionJournal, Checkpointer
+from src.service.backfill import compute_sessions
+from src.service.drift import DriftMonitor
+from src.service.governor import ResourceGovernor, degradation_levels
+from src.service.retention import RetentionManager
+from src.service.segmentation import Segmenter
+from src.features.definitions import CURRENT_VERSION
+from src.utils.segment_log import SegmentLog, SegmentWriter
 from src.utils.storage import EventStore
 from src.utils.config import load_config, ensure_dirs
 from src.utils.logging import setup_logging
 
-import time, uuid, threading
+from functools import partial
+from pathlib import Path
+import logging, time, uuid, threading
 
 class CaptureManager:
-    def __init__(self, cfg):
+    def __init__(self, cfg, window: WindowCapture = None):
+        """
+        :param window: window poller, slowed down by the resource governor when given
+        """
+        self.window = window
 
-        self.kb = KeyboardCapture()
-        self.mouse = MouseCapture()
+        self.memory_budget = int(float(cfg["capture"].get("memory_budget_mb", 16)) * 1024 * 1024)
+        self.kb = KeyboardCapture(memory_budget=self.memory_budget // 2)
+        self.mouse = MouseCapture(memory_budget=self.memory_budget // 2)
         self.session_start = None
+        self.session_id = None
         self.current_context = None
+        self.carried_duration = 0
+        # (session_id, start) of a held back session, continued by the next one
+        self.carried_session = None
         self.logger = setup_logging("logs")
         self.store = EventStore(cfg["paths"]["db_path"], self.logger, cfg["session_label"])
+        self.store.create_schema()
+        self.segmenter = Segmenter.from_config(cfg)
 
-    def on_window_change(self, context):
-        if self.current_context is not None:
-            self.end_session()
+        self.hooks = None
+        if cfg["capture"].get("hook_mode", "thread") == "process":
+            self.hooks = HookSupervisor(
+                self.kb, self.mouse, self.logger, capacity=int(cfg["capture"].get("ring_capacity", 65536))
+            )
 
-        self.current_context = context
-        self.session_start = time.time()
-        self.mouse.start_capture()
-        self.kb.start_capture()
+        self.retention = RetentionManager(cfg, self.logger, idle_seconds=self.idle_seconds)
+        if cfg.get("retention", {}).get("enabled", True):
+            self.retention.start()
+
+        self.raw_log = None
+        self.raw_segments = None
+        raw_cfg = cfg.get("raw_events", {})
+        if raw_cfg.get("enabled", False):
+            segments_dir = cfg["paths"].get("segments_dir")
+            if not segments_dir:
+                raise ValueError("raw_events.enabled requires paths.segments_dir")
+            self.raw_log = SegmentWriter(
+                segments_dir,
+                self.logger,
+                max_bytes=int(raw_cfg.get("max_segment_mb", 64)) * 1024 * 1024,
+                max_seconds=float(raw_cfg.get("max_segment_seconds", 3600)),
+            )
+            self.raw_segments = SegmentLog(segments_dir, self.logger)
+            self.kb.raw_sink = self.raw_log
+            self.mouse.raw_sink = self.raw_log
+
+        self.drift = DriftMonitor(self.store, cfg, self.logger) if cfg.get("drift", {}).get("enabled", True) else None
+        # (name, callable) feature updates postponed while the resource governor defers feature computation
+        self.defer_features = False
+        self.deferred: list = []
+
+        governor_cfg = cfg.get("governor", {})
+        self.governor = ResourceGovernor.from_config(
+            cfg, degradation_levels(cfg, self.mouse, self.window, self.logger, self._set_defer_features),
+            self.logger,
+        )
+        if governor_cfg.get("enabled", True):
+            self.governor.start()
+
+        checkpoint_cfg = cfg.get("checkpoint", {})
+        # Configs written before checkpointing have no journal_path
+        journal_path = cfg["paths"].get("journal_path") or Path(cfg["paths"]["data_dir"]) / "journal.jsonl"
+        self.journal = SessionJournal(journal_path, self.logger, fsync=checkpoint_cfg.get("fsync", True))
+        self.recover_session()
+        self.checkpointer = Checkpointer(self.checkpoint, float(checkpoint_cfg.get("interval", 30)), self.logger)
+        if checkpoint_cfg.get("enabled", True):
+            self.checkpointer.start()
+
+    def _set_defer_features(self, on: bool):
+        """Degradation level: postpone drift updates and feature computation"""
+        self.defer_features = on
+
+    def metrics(self) -> dict:
+        """Runtime metrics of the service components"""
+        metrics = {
+            "governor": self.governor.metrics(),
+            "journal": self.journal.metrics(),
+            "deferred_features": len(self.deferred),
+        }
+        if self.hooks is not None:
+            metrics["hooks"] = self.hooks.metrics()
+        return metrics
+
+    def last_input_time(self) -> float:
+        return max(self.kb.last_key_time, self.mouse.last_event_time)
+
+    def idle_seconds(self) -> float:
+        """Seconds since the last keyboard or mouse event"""
+        return time.time() - self.last_input_time()
+
+    def start_capture(self):
+        """Start the input listeners, they keep running across sessions"""
+        listen = self.hooks is None
+        self.mouse.start_capture(listen=listen)
+        self.kb.start_capture(listen=listen)
+        if self.hooks is not None:
+            self.hooks.start()
         threading.Thread(target=self.kb.monitor_typing_timeout, daemon=True).start()
 
+    def begin_session(self, context, start: float):
+        self.current_context = context
+        self.session_start = start
+        journal_start = start
+        if self.carried_session is not None:
+            # The held back data is still in the accumulators: keep its id so its raw events stay attached
+            self.session_id, journal_start = self.carried_session
+        else:
+            self.session_id = str(uuid.uuid4())
+        self.segmenter.begin(context, start)
+        if self.raw_log is not None:
+            self.raw_log.set_session(self.session_id)
+        self.journal.begin(self.session_id, context, journal_start)
 
-    def end_session(self):
-        self.kb.stop_capture()
-        self.mouse.stop_capture()
-        kb_summary = self.kb.get_summary()
-        mouse_summary = self.mouse.get_summary()
+    def on_window_change(self, context):
+        if self.current_context is None and not self.segmenter.is_idle:
+            self.start_capture()
+            self.begin_session(context, time.time())
+            return
+        self.segmenter.observe(context, time.time())
+
+    def on_tick(self):
+        """Apply the segmentation policy, called on every window poll"""
+        now = time.time()
+        if self.deferred and not self.defer_features:
+            self.flush_deferred()
+        if self.segmenter.is_idle:
+            resumed_at = self.segmenter.resume(self.last_input_time())
+            if resumed_at is not None:
+                self.begin_session(self.segmenter.context, resumed_at)
+            return
+
+        split = self.segmenter.tick(now, self.last_input_time())
+        if split is None:
+            return
+        reason, end, next_context, next_start = split
+        self.logger.info(f"Splitting session on {reason}")
+        self.end_session(end)
+        if next_start is None:
+            self.segmenter.mark_idle(end)
+        else:
+            self.begin_session(next_context, next_start)
 
-        self.logger.info(f"[+] Ending session {self.current_context}")
+    def end_session(self, end: float = None, final: bool = False):
+        """
+        Store the current session, or hold it back when it is too small.
+        Held back data stays in the accumulators and is carried into the next session.
+        :param end: end time of the session, defaults to now
+        :param final: no session follows (shutdown), store whatever was captured
+        """
+        end = end or time.time()
+        duration = max(end - self.session_start, 0) + self.carried_duration
+        events = self.kb.event_count() + self.mouse.event_count()
 
-        self.logger.info("Mouse summary collected")
-        self.log_statistics(mouse_summary, "MOUSE")
-        self.logger.info("Keyboard summary collected")
-        self.log_statistics(kb_summary, "KEYBOARD")
+        if not final and self.segmenter.hold_back(duration, events):
+            self.logger.debug(f"Holding back session {self.session_id} ({duration:.1f}s, {events} events)")
+            self.carried_duration = duration
+            if self.carried_session is None:
+                self.carried_session = (self.session_id, self.session_start)
+        elif events == 0:
+            self.logger.debug(f"Session {self.session_id} has no events, not stored")
+            self.carried_duration = 0
+            self.carried_session = None
+        else:
+            self.mouse.end_strokes()
+            kb_summary = self.kb.get_summary()
+            mouse_summary = self.mouse.get_summary()
 
+            self.logger.info(f"[+] Ending session {self.current_context}")
 
-        session_id = str(uuid.uuid4())
+            # Skipped while the resource governor has logging quieted
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info("Mouse summary collected")
+                self.log_statistics(mouse_summary, "MOUSE")
+                self.logger.info("Keyboard summary collected")
+                self.log_statistics(kb_summary, "KEYBOARD")
+
+            if self.raw_log is not None:
+                self.raw_log.flush()
+            started_at = self.carried_session[1] if self.carried_session is not None else self.session_start
+            # After a context switch the accumulators also hold the events of the next
+            # context until the split was confirmed: the data ends at the last event
+            ended_at = max(end, self.last_input_time())
+            self.store_session(self.session_id, round(duration, 2), kb_summary, mouse_summary, self.current_context,
+                               started_at, ended_at)
+            self.journal.end()
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info(f"Service metrics: {self.metrics()}")
+            self.kb.clear_data()
+            self.mouse.clear_data()
+            self.carried_duration = 0
+            self.carried_session = None
+
+        self.current_context = None
+        self.session_start = None
+        self.session_id = None
+
+    def shutdown(self):
+        """Close the current session and stop all background work"""
+        if self.session_id is None and self.carried_session is not None:
+            # Held back, then idle: store it rather than dropping it with the journal
+            self.begin_session(self.current_context or self.segmenter.context, time.time())
+        if self.session_id is not None:
+            self.end_session(final=True)
+        self.flush_deferred()
+        self.governor.stop()
+        self.checkpointer.stop()
+        self.retention.stop()
+        if self.hooks is not None:
+            self.hooks.stop()
+        self.kb.stop_capture()
+        self.mouse.stop_capture()
+        if self.raw_log is not None:
+            self.raw_log.close()
+        self.journal.end()
+
+    def store_session(self, session_id: str, duration: float, kb_summary: dict, mouse_summary: dict,
+                      context: str = None, started_at: float = None, ended_at: float = None):
+        """
+        Write a session and its keyboard/mouse aggregates
+        :param context: foreground window/app context of the session, the aggregates are kept per context
+        :param started_at: start time of the session (of its first held back part), bounds its raw events
+        :param ended_at: end time of the session
+        """
         self.store.upsert_session(
             session_id=session_id,
-            context="capture",
-            duration=round(int(time.time())-self.session_start, 2)
+            context=context,
+            duration=duration,
+            started_at=started_at,
+            ended_at=ended_at,
         )
 
         self.logger.info("Session inserted")
 
-        self.store.upsert_mouse_data(
-            session_id=session_id,
+        mouse_values = dict(
             avg_dx=round(mouse_summary.get("movement", {}).get("avg_dx"), 2),
             avg_dy=round(mouse_summary.get("movement", {}).get("avg_dy"), 2),
             avg_scroll_distance=round(mouse_summary.get("scroll", {}).get("avg_scroll_distance"), 2),
             avg_click_interval=round(mouse_summary.get("click", {}).get("avg_click_interval"), 2),
             clicks_per_minute=round(mouse_summary.get("click", {}).get("clicks_per_minute"), 2),
         )
+        # Stroke means are None when no stroke had the feature (e.g. no click followed a stroke)
+        mouse_values.update({
+            column: value if value is None or column == "stroke_count" else round(value, 4)
+            for column, value in mouse_summary.get("strokes", {}).items() if column != "sampling_rate"
+        })
+        self.store.upsert_mouse_data(session_id=session_id, **mouse_values)
 
         self.logger.info("Mouse data inserted")
 
-        self.store.upsert_kb_data(
-            session_id=session_id,
+        kb_values = dict(
             avg_cpm=round(kb_summary.get("type_speed", {}).get("avg_cpm"), 2),
             median_cpm=round(kb_summary.get("type_speed", {}).get("median_cpm"), 2),
             keystroke_count=round(kb_summary.get("keystrokes", {}).get("keystroke_count"), 2),
             shortcut_count=round(kb_summary.get("keystrokes", {}).get("shortcut_count"), 2),
             avg_hold_time=round(kb_summary.get("keystrokes", {}).get("avg_hold_time"), 2),
         )
+        self.store.upsert_kb_data(session_id=session_id, **kb_values)
 
         self.logger.info("Keyboard data inserted")
 
+        timing = kb_summary.get("timing", {})
+        self.store.upsert_kb_timing(
+            session_id=session_id,
+            dwell=timing.get("dwell"),
+            flight=timing.get("flight"),
+        )
 
-        self.current_context = None
-        self.session_start = None
+        self.logger.info("Keystroke timing inserted")
+
+        if self.drift is not None:
+            self.deferred.append(
+                ("Drift update", partial(self.drift.observe, self.store.label, {**kb_values, **mouse_values}, time.time()))
+            )
+        self.deferred.append(("Feature computation", partial(self.compute_features, session_id)))
+        if not self.defer_features:
+            self.flush_deferred()
+
+    def compute_features(self, session_id: str):
+        """Write the current feature version of a stored session"""
+        rows = compute_sessions(self.store.conn, self.raw_segments, CURRENT_VERSION, [session_id])
+        self.store.upsert_session_features(rows)
+
+    def flush_deferred(self):
+        """Run the feature updates postponed by the resource governor"""
+        while self.deferred:
+            name, task = self.deferred.pop(0)
+            try:
+                task()
+            except Exception as e:
+                self.logger.error(f"{name} failed: {e}")
+
+    def checkpoint(self):
+        """Journal the in-flight session (called from the checkpointer thread)"""
+        self.journal.checkpoint({"kb": self.kb, "mouse": self.mouse})
+
+    def recover_session(self):
+        """Store the session left in the journal by a crashed or killed run"""
+        session = self.journal.load()
+        if session is None:
+            return
+        if "kb" not in session and "mouse" not in session:
+            self.logger.info(f"Journaled session {session['session_id']} has no checkpoint, skipped")
+        elif self.store.has_session(session["session_id"]):
+            self.logger.info(f"Journaled session {session['session_id']} already stored")
+        else:
+            kb = KeyboardCapture(memory_budget=self.memory_budget // 2)
+            mouse = MouseCapture(memory_budget=self.memory_budget // 2)
+            kb.load_checkpoint(**session.get("kb", {"series": {}, "state": {}}))
+            mouse.load_checkpoint(**session.get("mouse", {"series": {}, "state": {}}))
+            duration = session["end"] - session["start"]
+            if self.segmenter.hold_back(duration, kb.event_count() + mouse.event_count()):
+                self.logger.info(f"Journaled session {session['session_id']} too small, dropped")
+                self.journal.end()
+                return
+            self.store_session(
+                session["session_id"],
+                round(duration, 2),
+                kb.get_summary(),
+                mouse.get_summary(),
+                session.get("context"),
+                session["start"],
+                session["end"],
+            )
+            self.logger.info(f"Recovered session {session['session_id']} from journal")
+        self.journal.end()
 
     def log_statistics(self, summary: dict, source: str):
         """
@@ -102,7 +371,7 @@ if __name__ == "__main__":
     ensure_dirs(cfg)
 
     wc = WindowCapture(window_poll_interval=float(cfg["capture"]["window_poll_interval"]))
-    cm = CaptureManager(cfg)
-    wc.run(cm.on_window_change)
+    cm = CaptureManager(cfg, window=wc)
+    wc.run(cm.on_window_change, on_tick=cm.on_tick, on_stop=cm.shutdown)
 
 
@@ -0,0 +1,150 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Optional
+import json, logging, os, threading, time
+
+
+class SessionJournal:
+    """
+    Small append-only journal of the in-flight session.
+
+    A ``begin`` line is written when a session starts, then every checkpoint
+    appends only what the capture accumulators gained since the previous one
+    (new and replaced reservoir samples, current moments, plus small
+    fixed-size state), so its cost is bounded by activity and the capture
+    memory budget. The journal is
+    truncated once the session is stored, so after a crash it holds exactly
+    the session that was lost and can be replayed by ``load``.
+    """
+    def __init__(self, path: str | Path, logger: logging.Logger, fsync: bool = True):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.logger = logger
+        self.fsync = fsync
+
+        self.lock = threading.Lock()
+        self.session_id: Optional[str] = None
+        self.cursors: dict = {}
+
+        self.checkpoints: int = 0
+        self.last_ms: float = 0
+        self.max_ms: float = 0
+        self.last_bytes: int = 0
+        self.total_bytes: int = 0
+
+    def _append(self, record: dict) -> int:
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        with open(self.path, "ab") as f:
+            f.write(line)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        return len(line)
+
+    def begin(self, session_id: str, context: str, start: float):
+        """Start journaling a new session, dropping the previous one"""
+        with self.lock:
+            self.session_id = session_id
+            self.cursors = {}
+            self.path.write_bytes(b"")
+            self._append({"type": "begin", "session_id": session_id, "context": context, "start": start})
+
+    def end(self):
+        """The session has been stored, nothing left to recover"""
+        with self.lock:
+            self.session_id = None
+            self.cursors = {}
+            self.path.write_bytes(b"")
+
+    def checkpoint(self, captures: dict) -> None:
+        """
+        Append the delta of every capture accumulator since the last checkpoint
+        :param captures: name -> capture object exposing ``CHECKPOINT_SERIES`` and ``get_checkpoint_state``
+        """
+        with self.lock:
+            if self.session_id is None:
+                return
+            start = time.perf_counter()
+
+            record = {"type": "checkpoint", "session_id": self.session_id, "t": time.time()}
+            for name, capture in captures.items():
+                series = {}
+                for field in capture.CHECKPOINT_SERIES:
+                    key = f"{name}.{field}"
+                    series[field], self.cursors[key] = getattr(capture, field).state_delta(self.cursors.get(key, 0))
+                record[name] = {"series": series, "state": capture.get_checkpoint_state()}
+
+            self.last_bytes = self._append(record)
+            self.total_bytes += self.last_bytes
+            self.checkpoints += 1
+            self.last_ms = (time.perf_counter() - start) * 1000
+            self.max_ms = max(self.max_ms, self.last_ms)
+
+        self.logger.debug(f"Checkpoint {self.checkpoints}: {self.last_bytes} bytes in {self.last_ms:.2f} ms")
+
+    def load(self) -> Optional[dict]:
+        """
+        Replay the journal left by a previous run
+        :return: ``{"session_id", "context", "start", "end", <capture>: {"series", "state"}}`` or None,
+                 where ``series`` maps each field to its deltas in order
+        """
+        if not self.path.exists():
+            return None
+
+        session = None
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn last line, everything before it is still valid
+                    self.logger.warning("Ignoring torn journal record")
+                    break
+
+                if record["type"] == "begin":
+                    session = {**record, "end": record["start"]}
+                elif record["type"] == "checkpoint" and session is not None:
+                    session["end"] = record["t"]
+                    for name, delta in record.items():
+                        if not isinstance(delta, dict):
+                            continue
+                        data = session.setdefault(name, {"series": {}, "state": {}})
+                        for field, series_delta in delta["series"].items():
+                            data["series"].setdefault(field, []).append(series_delta)
+                        data["state"] = delta["state"]
+        return session
+
+    def metrics(self) -> dict:
+        return {
+            "checkpoints": self.checkpoints,
+            "last_ms": round(self.last_ms, 3),
+            "max_ms": round(self.max_ms, 3),
+            "last_bytes": self.last_bytes,
+            "total_bytes": self.total_bytes,
+        }
+
+
+class Checkpointer:
+    """Calls ``checkpoint`` every ``interval`` seconds from a daemon thread"""
+    def __init__(self, checkpoint: Callable[[], None], interval: float, logger: logging.Logger):
+        self.checkpoint = checkpoint
+        self.interval = interval
+        self.logger = logger
+        self.running = False
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.interval)
+            try:
+                self.checkpoint()
+            except Exception as e:
+                self.logger.error(f"Checkpoint failed: {e}")
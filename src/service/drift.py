@@ -0,0 +1,233 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional
+
+from src.features.column_stats import COLUMN_BIN_EDGES
+from src.features.sketch import KLLSketch, DecayedMoments
+from src.utils.config import load_config, ensure_dirs
+from src.utils.logging import setup_logging
+from src.utils.storage import EventStore
+
+import argparse, csv, json, logging, math, time
+
+DAY = 86400
+
+# Drift is tracked for every aggregated keyboard_data/mouse_data column
+FEATURES = tuple(column for columns in COLUMN_BIN_EDGES.values() for column in columns)
+
+
+class DriftMonitor:
+    """
+    Compares each label's baseline distribution of every feature with its
+    recent behavior, using fixed-size sketches persisted in ``drift_sketches``:
+
+    - a KLL sketch of the baseline and one of the current window (a few KB each)
+    - exponentially decayed moments with a ``half_life_days`` half-life
+
+    Once the window holds ``window_sessions`` values it is tested against the
+    baseline with a two-sample Kolmogorov-Smirnov test, then folded into the
+    baseline. Drifting features are recorded in ``drift_events`` as alerts, and
+    a retrain event is added when ``retrain_features`` of them drift together.
+    """
+    def __init__(self, store: EventStore, cfg: dict, logger: logging.Logger):
+        drift = cfg.get("drift", {})
+        self.store = store
+        self.logger = logger
+        self.k: int = int(drift.get("k", 128))
+        self.window: int = int(drift.get("window_sessions", 30))
+        self.min_baseline: int = int(drift.get("min_baseline", 100))
+        self.alpha: float = float(drift.get("alpha", 0.01))
+        self.min_ks: float = float(drift.get("min_ks", 0.1))
+        self.half_life: float = float(drift.get("half_life_days", 7)) * DAY
+        self.retrain_features: int = int(drift.get("retrain_features", 3))
+
+    def threshold(self, n: int, m: int) -> float:
+        """KS rejection threshold at ``alpha`` for sample sizes n and m, never below ``min_ks``"""
+        c_alpha = math.sqrt(-math.log(self.alpha / 2) / 2)
+        return max(c_alpha * math.sqrt((n + m) / (n * m)), self.min_ks)
+
+    def _load(self, label: str) -> dict:
+        rows = self.store.conn.execute(
+            "SELECT feature, baseline, recent, moments FROM drift_sketches WHERE label = ?", (label,)
+        )
+        return {
+            feature: (
+                KLLSketch.from_bytes(baseline),
+                KLLSketch.from_bytes(recent),
+                DecayedMoments.from_list(self.half_life, json.loads(moments)),
+            )
+            for feature, baseline, recent, moments in rows
+        }
+
+    def _new(self) -> tuple[KLLSketch, KLLSketch, DecayedMoments]:
+        return KLLSketch(self.k), KLLSketch(self.k), DecayedMoments(self.half_life)
+
+    def _save(self, label: str, sketches: dict) -> None:
+        self.store.conn.executemany(
+            """
+            INSERT OR REPLACE INTO drift_sketches (label, feature, baseline, recent, moments, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (label, feature, baseline.to_bytes(), recent.to_bytes(), json.dumps(moments.to_list()), time.time())
+                for feature, (baseline, recent, moments) in sketches.items()
+            ],
+        )
+
+    def _record(self, label: str, feature: str, action: str, ks: float = 0.0, threshold: float = 0.0,
+                baseline: Optional[KLLSketch] = None, recent: Optional[KLLSketch] = None,
+                moments: Optional[DecayedMoments] = None) -> dict:
+        event = {
+            "label": label,
+            "feature": feature,
+            "detected_at": time.time(),
+            "ks": ks,
+            "threshold": threshold,
+            "baseline_n": baseline.n if baseline else None,
+            "recent_n": recent.n if recent else None,
+            "baseline_median": baseline.quantile(0.5) if baseline else None,
+            "recent_median": recent.quantile(0.5) if recent else None,
+            "decayed_mean": moments.mean if moments else None,
+            "action": action,
+        }
+        self.store.conn.execute(
+            f"INSERT INTO drift_events ({', '.join(event)}) VALUES ({', '.join(':' + k for k in event)})", event
+        )
+        return event
+
+    def observe(self, label: str, values: dict, t: Optional[float] = None) -> list[dict]:
+        """
+        Feed the feature values of one stored session
+        :param values: feature -> value, missing or None values are skipped
+        :return: drift events raised by this session
+        """
+        t = t or time.time()
+        sketches = self._load(label)
+        events = []
+        with self.store.conn:
+            for feature in FEATURES:
+                if values.get(feature) is None:
+                    continue
+                baseline, recent, moments = sketches.setdefault(feature, self._new())
+                value = float(values[feature])
+                recent.update(value)
+                moments.update(value, t)
+                if recent.n < self.window:
+                    continue
+
+                if baseline.n >= self.min_baseline:
+                    ks = baseline.ks_distance(recent)
+                    threshold = self.threshold(baseline.n, recent.n)
+                    if ks > threshold:
+                        events.append(self._record(label, feature, "alert", ks, threshold, baseline, recent, moments))
+                baseline.merge(recent)
+                sketches[feature] = (baseline, KLLSketch(self.k), moments)
+
+            if len(events) >= self.retrain_features:
+                events.append(self._record(label, "*", "retrain"))
+            self._save(label, sketches)
+
+        alerts = [event for event in events if event["action"] == "alert"]
+        for event in alerts:
+            self.logger.warning(
+                f"Drift alert for {label}/{event['feature']}: "
+                f"KS {event['ks']:.3f} > {event['threshold']:.3f}"
+            )
+        if len(alerts) < len(events):
+            self.logger.warning(
+                f"Retrain suggested for {label}: {len(alerts)} features drifted "
+                f"({', '.join(event['feature'] for event in alerts)})"
+            )
+        return events
+
+    def import_csv(self, path: str | Path) -> int:
+        """
+        Merge the sessions of an exported/interim CSV into the baselines, once per file
+        :return: number of rows merged
+        """
+        path = Path(path)
+        if self.store.conn.execute("SELECT 1 FROM drift_imports WHERE file_name = ?", (path.name,)).fetchone():
+            return 0
+
+        imported: dict = {}
+        rows = 0
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                label = row.get("label") or "unlabeled"
+                t = float(row.get("created_at") or time.time())
+                for feature in FEATURES:
+                    try:
+                        value = float(row[feature])
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    sketch, moments = imported.setdefault((label, feature), (KLLSketch(self.k), DecayedMoments(self.half_life)))
+                    sketch.update(value)
+                    moments.update(value, t)
+                rows += 1
+
+        with self.store.conn:
+            for label in {label for label, _ in imported}:
+                sketches = self._load(label)
+                for (row_label, feature), (sketch, moments) in imported.items():
+                    if row_label != label:
+                        continue
+                    baseline, recent, current = sketches.setdefault(feature, self._new())
+                    baseline.merge(sketch)
+                    current.merge(moments)
+                self._save(label, sketches)
+            self.store.conn.execute(
+                "INSERT INTO drift_imports (file_name, imported_at) VALUES (?, ?)", (path.name, time.time())
+            )
+        self.logger.info(f"Merged {rows} rows of {path.name} into the drift baselines")
+        return rows
+
+    def status(self) -> list[dict]:
+        """Current baseline/window comparison of every label and feature"""
+        labels = [row[0] for row in self.store.conn.execute("SELECT DISTINCT label FROM drift_sketches")]
+        report = []
+        for label in labels:
+            for feature, (baseline, recent, moments) in self._load(label).items():
+                report.append({
+                    "label": label,
+                    "feature": feature,
+                    "baseline_n": baseline.n,
+                    "recent_n": recent.n,
+                    "ks": round(baseline.ks_distance(recent), 4),
+                    "threshold": round(self.threshold(baseline.n, recent.n), 4) if baseline.n and recent.n else None,
+                    "baseline_median": baseline.quantile(0.5),
+                    "recent_median": recent.quantile(0.5),
+                    "decayed_mean": moments.mean,
+                    "decayed_std": math.sqrt(moments.variance),
+                })
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-label feature drift monitoring")
+    parser.add_argument("--config", default="config.yaml", help="Configuration file path")
+    parser.add_argument("--import-interim", action="store_true", help="Merge the interim CSVs into the baselines")
+    parser.add_argument("--events", action="store_true", help="List the drift events not handled yet")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    ensure_dirs(cfg)
+    logger = setup_logging(cfg["paths"]["logs_dir"])
+    store = EventStore(cfg["paths"]["db_path"], logger, cfg["session_label"])
+    store.create_schema()
+    monitor = DriftMonitor(store, cfg, logger)
+
+    if args.import_interim:
+        for path in sorted(Path(cfg["paths"]["interim_dir"]).glob("*.csv")):
+            monitor.import_csv(path)
+
+    if args.events:
+        cursor = store.conn.execute("SELECT * FROM drift_events WHERE handled = 0 ORDER BY detected_at")
+        columns = [c[0] for c in cursor.description]
+        print(json.dumps([dict(zip(columns, row)) for row in cursor], indent=2))
+    else:
+        print(json.dumps(monitor.status(), indent=2))
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
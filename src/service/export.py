@@ -1,8 +1,44 @@
+from typing import Optional
+from src.features.keystroke_timing import TimingMatrix
 from src.utils.config import load_config, ensure_dirs
 from src.utils.logging import setup_logging
-import sqlite3, pathlib, hashlib, csv, requests, os
+from src.utils.storage import EXPORT_BUNDLES_SQL
+import argparse, sqlite3, pathlib, hashlib, csv, io, json, requests, os, time, zipfile
 import pandas as pd
 
+# Tables with several rows per session (one per feature version) cannot be merged into one CSV row
+MULTI_ROW_TABLES = ("session_features",)
+# Timing histogram BLOBs (6400 bytes each) are exported as their per-cell mean durations: column -> feature prefix
+HISTOGRAM_COLUMNS = {"dwell_hist": "dwell", "flight_hist": "flight"}
+
+BUNDLE_MANIFEST = "manifest.json"
+# Session ids sent per known-sessions request
+KNOWN_QUERY_SIZE = 1000
+
+
+class _HashingWriter(io.RawIOBase):
+    """
+    Write-only stream that hashes and counts the bytes passed through to ``fp``.
+    It is not seekable, so ``zipfile`` writes entries in one forward pass
+    (sizes and CRCs in data descriptors) and the hash is that of the final bytes.
+    """
+    def __init__(self, fp):
+        self.fp = fp
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        self.fp.write(data)
+        return len(data)
+
+    def hexdigest(self) -> str:
+        return self.sha256.hexdigest()
+
 class Exporter:
     def __init__(self, cfg):
         self.db_path = cfg['paths']['db_path']
@@ -10,6 +46,11 @@ class Exporter:
         self.label = cfg["session_label"]
         self.logger = setup_logging(cfg["paths"]["logs_dir"])
         self.base_url = cfg["base_url"]
+        export = cfg.get("export", {})
+        self.bundle_max_parts = int(export.get("bundle_max_parts", 50))
+        self.compress_level = int(export.get("compress_level", 6))
+        # Cleared when the server has no known-sessions endpoint
+        self.dedup_supported = True
 
     def _get_db(self):
         """Connect to SQLite DB and return connection"""
@@ -55,14 +96,28 @@ class Exporter:
                         if "session_id" not in col_names:
                             self.logger.warning(f"Skipping table `{table}` (no session_id column)")
                             continue
+                        if table in MULTI_ROW_TABLES:
+                            self.logger.info(f"Skipping table `{table}` (several rows per session)")
+                            continue
 
                         cursor.execute(f"SELECT * FROM {table}")
-                        rows = cursor.fetchall()
+                        rows = [dict(zip(col_names, row)) for row in cursor.fetchall()]
                         self.logger.info(f"Table `{table}` has {len(rows)} rows")
 
+                        for column, prefix in HISTOGRAM_COLUMNS.items():
+                            if column not in col_names:
+                                continue
+                            col_names.remove(column)
+                            col_names += TimingMatrix().to_features(prefix)
+                            for row in rows:
+                                try:
+                                    row.update(TimingMatrix.from_bytes(row.pop(column) or b"").to_features(prefix))
+                                except ValueError:
+                                    pass  # histogram of another layout, its features stay empty
+
                         table_data[table] = {
                             "columns": col_names,
-                            "rows": [dict(zip(col_names, row)) for row in rows]
+                            "rows": rows
                         }
                         all_columns += col_names
                     except Exception as e:
@@ -110,7 +165,11 @@ class Exporter:
                             if session_id not in sessions.keys():
                                 continue
 
-                            sessions[session_id].update({k: v for k, v in r.items() if k != "id"})
+                            # Any other BLOB column is exported as hex
+                            sessions[session_id].update({
+                                k: v.hex() if isinstance(v, bytes) else v
+                                for k, v in r.items() if k != "id"
+                            })
                         self.logger.info(f"Merged {len(rows)} rows from table `{table_name}` into sessions")
                     except Exception as e:
                         self.logger.error(f"Failed to merge table `{table_name}`: {e}")
@@ -151,10 +210,11 @@ class Exporter:
                 sha256.update(chunk)
         return sha256.hexdigest()
 
-    def upload_to_server(self, csv_output_path: pathlib.Path):
-        """Upload the output file to server"""
+    def upload_to_server(self, csv_output_path: pathlib.Path, checksum: Optional[str] = None,
+                         content_type: str = "text/csv"):
+        """Upload the output file to server (``checksum``: SHA256 when already known)"""
         file_size = csv_output_path.stat().st_size
-        checksum = self.calculate_checksum(csv_output_path)
+        checksum = checksum or self.calculate_checksum(csv_output_path)
 
         self.logger.info(f"Uploading {file_size} bytes to server")
 
@@ -176,19 +236,151 @@ class Exporter:
         with open(csv_output_path, "rb") as f:
             upload_resp = requests.put(
                 upload_url,
-                headers={"Authorization": f"Bearer {token}", "Content-Type": "text/csv"},
+                headers={"Authorization": f"Bearer {token}", "Content-Type": content_type},
                 data=f,
             )
         upload_resp.raise_for_status()
 
         self.logger.info(f"Uploaded to server")
 
-
-if __name__ == "__main__":
-    cfg = load_config("config.yaml")
+    # Bundles
+
+    def known_sessions(self, session_ids: list[str]) -> set[str]:
+        """Session ids of ``session_ids`` the server already has (none when it cannot tell)"""
+        known = set()
+        if not self.dedup_supported:
+            return known
+        for i in range(0, len(session_ids), KNOWN_QUERY_SIZE):
+            try:
+                resp = requests.post(
+                    f"{self.base_url}/api/sessions/known",
+                    json={"label": self.label, "session_ids": session_ids[i:i + KNOWN_QUERY_SIZE]},
+                )
+                if resp.status_code == 404:
+                    self.logger.info("Server has no known-sessions endpoint, dedup unsupported: uploading all sessions")
+                    self.dedup_supported = False
+                    return set()
+                resp.raise_for_status()
+                known.update(resp.json()["known"])
+            except (requests.RequestException, KeyError, ValueError) as e:
+                self.logger.warning(f"Could not query known sessions, uploading all of them: {e}")
+                return set()
+        return known
+
+    def write_bundle(self, bundle_path: pathlib.Path, parts: list[pathlib.Path], skip: set[str]) -> tuple[str, dict]:
+        """
+        Write CSV exports as one zip, without the rows of ``skip`` or repeated sessions.
+        Each part is hashed before compression and the zip while it is written,
+        in the same pass over the rows.
+        :return: (SHA256 of the bundle, manifest)
+        """
+        manifest = {"label": self.label, "created_at": time.time(), "session_count": 0, "parts": []}
+        seen = set(skip)
+        with bundle_path.open("wb") as f:
+            out = _HashingWriter(f)
+            with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED, compresslevel=self.compress_level) as bundle:
+                for path in parts:
+                    with path.open(newline="", encoding="utf-8") as source:
+                        reader = csv.reader(source)
+                        header = next(reader, None)
+                        if not header or "session_id" not in header:
+                            self.logger.warning(f"Skipping {path.name} (no session_id column)")
+                            continue
+                        id_index = header.index("session_id")
+
+                        session_ids = []
+                        with bundle.open(path.name, "w") as entry:
+                            part = _HashingWriter(entry)
+                            text = io.TextIOWrapper(io.BufferedWriter(part, 1 << 16), encoding="utf-8", newline="")
+                            writer = csv.writer(text)
+                            writer.writerow(header)
+                            for row in reader:
+                                if row[id_index] in seen:
+                                    continue
+                                seen.add(row[id_index])
+                                session_ids.append(row[id_index])
+                                writer.writerow(row)
+                            text.flush()
+                            text.detach().detach()
+                    if session_ids:
+                        manifest["parts"].append({
+                            "name": path.name, "sha256": part.hexdigest(), "size": part.size,
+                            "rows": len(session_ids), "session_ids": session_ids,
+                        })
+                        manifest["session_count"] += len(session_ids)
+                bundle.writestr(BUNDLE_MANIFEST, json.dumps(manifest))
+        return out.hexdigest(), manifest
+
+    def upload_bundles(self) -> int:
+        """
+        Pack the CSV exports not bundled yet into compressed bundles of up to
+        ``bundle_max_parts`` parts and upload each with one presign round-trip.
+        Sessions the server reports as known are left out, so exports repeated
+        across runs or machines are not sent twice.
+        :return: number of sessions uploaded
+        """
+        # Only the ledger table: the full schema (migrations, VACUUM) belongs to the capture service
+        conn = self._get_db()
+        conn.executescript(EXPORT_BUNDLES_SQL)
+        bundled = {name for (name,) in conn.execute("SELECT file_name FROM export_bundles")}
+        pending = [path for path in sorted(pathlib.Path(self.output_path).glob("*.csv")) if path.name not in bundled]
+        bundle_dir = pathlib.Path(self.output_path) / "bundles"
+        bundle_dir.mkdir(exist_ok=True)
+
+        uploaded = 0
+        try:
+            for i in range(0, len(pending), self.bundle_max_parts):
+                parts = pending[i:i + self.bundle_max_parts]
+                session_ids = []
+                for path in parts:
+                    with path.open(newline="", encoding="utf-8") as f:
+                        session_ids += [row["session_id"] for row in csv.DictReader(f) if row.get("session_id")]
+                known = self.known_sessions(session_ids)
+
+                bundle_path = bundle_dir / f"bundle_{int(time.time() * 1000)}.zip"
+                try:
+                    checksum, manifest = self.write_bundle(bundle_path, parts, known)
+                    sessions = manifest["session_count"]
+                    if sessions:
+                        self.logger.info(
+                            f"Bundle {bundle_path.name}: {len(manifest['parts'])} parts, {sessions} sessions "
+                            f"({len(known)} already on the server), {bundle_path.stat().st_size} bytes"
+                        )
+                        self.upload_to_server(bundle_path, checksum, "application/zip")
+                    else:
+                        self.logger.info(f"Nothing new in {len(parts)} exports, all sessions already on the server")
+                finally:
+                    bundle_path.unlink(missing_ok=True)
+
+                rows = {part["name"]: part["rows"] for part in manifest["parts"]}
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO export_bundles (file_name, bundle, sessions, bundled_at) VALUES (?, ?, ?, ?)",
+                        [(path.name, bundle_path.name if sessions else None, rows.get(path.name, 0), time.time())
+                         for path in parts],
+                    )
+                uploaded += sessions
+        finally:
+            conn.close()
+        return uploaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the recorded sessions and upload them")
+    parser.add_argument("--config", default="config.yaml", help="Configuration file path")
+    parser.add_argument("--bundle", action="store_true", help="Upload the pending exports as compressed bundles")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
     ensure_dirs(cfg)
 
     exporter = Exporter(cfg)
     csv_output_path, is_new_data = exporter.export_to_csv()
-    if is_new_data:
+    if args.bundle or cfg.get("export", {}).get("bundle", False):
+        exporter.upload_bundles()
+    elif is_new_data:
         exporter.upload_to_server(csv_output_path)
+
+
+if __name__ == "__main__":
+    main()
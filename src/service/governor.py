@@ -0,0 +1,306 @@
+from __future__ import annotations
+from types import SimpleNamespace
+from typing import Callable, Optional
+import argparse, logging, os, sys, threading, time
+
+from src.capture.synthetic import SyntheticEventDriver
+from src.utils.config import load_config
+from src.utils.events import KIND_MOVE
+
+try:
+    import psutil
+except ImportError:  # optional, RSS falls back to /proc or getrusage
+    psutil = None
+
+# A degradation level: (name, apply) where apply(True) degrades and apply(False) restores
+Level = tuple[str, Callable[[bool], None]]
+
+
+def degradation_levels(cfg: dict, mouse, window, logger: logging.Logger,
+                       defer: Callable[[bool], None]) -> list[Level]:
+    """
+    Degradation levels of the capture service, applied in order
+    :param mouse: capture whose ``move_interval`` decimates pointer moves
+    :param window: window poller (``window_poll_interval``) or None
+    :param logger: service logger, raised to WARNING to turn off info/debug instrumentation
+    :param defer: switches deferred feature computation on/off
+    """
+    governor = cfg.get("governor", {})
+    decimated_move_hz = float(governor.get("decimated_move_hz", 30))
+    slow_poll_factor = float(governor.get("slow_poll_factor", 4))
+    base_poll = window.window_poll_interval if window is not None else None
+    base_log_level = logger.level
+
+    def decimate(on: bool):
+        mouse.move_interval = 1 / decimated_move_hz if on else 0.0
+
+    def slow_poll(on: bool):
+        if window is not None:
+            window.window_poll_interval = base_poll * slow_poll_factor if on else base_poll
+
+    def quiet(on: bool):
+        # Level changes are logged as warnings, so they still show
+        logger.setLevel(logging.WARNING if on else base_log_level)
+
+    return [
+        ("mouse_decimation", decimate),
+        ("slow_window_poll", slow_poll),
+        ("quiet_logging", quiet),
+        ("defer_features", defer),
+    ]
+
+
+def process_rss() -> float:
+    """Resident set size of this process in bytes"""
+    if psutil is not None:
+        return float(psutil.Process().memory_info().rss)
+    try:
+        with open("/proc/self/statm") as f:
+            return float(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # Peak rather than current RSS, kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return float(peak if sys.platform == "darwin" else peak * 1024)
+
+
+class ResourceGovernor:
+    """
+    Keeps the service within a CPU/RSS budget by stepping through degradation
+    levels. Every ``interval`` seconds it samples its own CPU time and RSS:
+
+    - over budget for ``escalate_after`` samples in a row: apply the next level
+    - under ``recover_fraction`` of the budget for ``recover_after`` samples: undo the last level
+
+    The gap between the two thresholds and the sample counts give hysteresis,
+    so the level does not flap around the budget.
+    """
+    def __init__(self, levels: list[Level], logger: logging.Logger, cpu_percent: float = 5.0,
+                 rss_mb: float = 256, interval: float = 5.0, escalate_after: int = 2,
+                 recover_after: int = 6, recover_fraction: float = 0.6,
+                 sample: Optional[Callable[[], tuple[float, float]]] = None):
+        """
+        :param cpu_percent: CPU budget in percent of one core
+        :param sample: returns (cpu percent, rss bytes), defaults to measuring this process
+        """
+        self.levels = levels
+        self.logger = logger
+        self.cpu_budget = cpu_percent
+        self.rss_budget = rss_mb * 1024 * 1024
+        self.interval = interval
+        self.escalate_after = escalate_after
+        self.recover_after = recover_after
+        self.recover_fraction = recover_fraction
+        self.sample = sample or self._measure
+
+        self.level = 0
+        self.over = 0
+        self.under = 0
+        self.cpu: float = 0.0
+        self.rss: float = 0.0
+        self.changes = 0
+        self.level_seconds = [0.0] * (len(levels) + 1)
+        self.level_since = time.monotonic()
+        self.last_cpu = time.process_time()
+        self.last_wall = time.monotonic()
+        self.running = False
+
+    @classmethod
+    def from_config(cls, cfg: dict, levels: list[Level], logger: logging.Logger) -> "ResourceGovernor":
+        governor = cfg.get("governor", {})
+        return cls(
+            levels, logger,
+            cpu_percent=float(governor.get("cpu_percent", 5.0)),
+            rss_mb=float(governor.get("rss_mb", 256)),
+            interval=float(governor.get("interval", 5.0)),
+            escalate_after=int(governor.get("escalate_after", 2)),
+            recover_after=int(governor.get("recover_after", 6)),
+            recover_fraction=float(governor.get("recover_fraction", 0.6)),
+        )
+
+    def _measure(self) -> tuple[float, float]:
+        cpu, wall = time.process_time(), time.monotonic()
+        percent = (cpu - self.last_cpu) / max(wall - self.last_wall, 1e-9) * 100
+        self.last_cpu, self.last_wall = cpu, wall
+        return percent, process_rss()
+
+    @property
+    def level_name(self) -> str:
+        return self.levels[self.level - 1][0] if self.level else "normal"
+
+    def _set_level(self, level: int):
+        now = time.monotonic()
+        self.level_seconds[self.level] += now - self.level_since
+        self.level_since = now
+        previous = self.level_name
+        if level > self.level:
+            self.levels[level - 1][1](True)
+        else:
+            self.levels[self.level - 1][1](False)
+        self.level = level
+        self.changes += 1
+        self.over = self.under = 0
+        self.logger.warning(
+            f"Resource governor: {previous} -> {self.level_name} "
+            f"(cpu {self.cpu:.1f}% / {self.cpu_budget:.1f}%, rss {self.rss / 2 ** 20:.0f} / {self.rss_budget / 2 ** 20:.0f} MB)"
+        )
+
+    def step(self) -> int:
+        """Take one sample and change level if needed, returns the current level"""
+        self.cpu, self.rss = self.sample()
+        if self.cpu > self.cpu_budget or self.rss > self.rss_budget:
+            self.over += 1
+            self.under = 0
+            if self.over >= self.escalate_after and self.level < len(self.levels):
+                self._set_level(self.level + 1)
+        elif (self.cpu < self.cpu_budget * self.recover_fraction
+              and self.rss < self.rss_budget * self.recover_fraction):
+            self.under += 1
+            self.over = 0
+            if self.under >= self.recover_after and self.level > 0:
+                self._set_level(self.level - 1)
+        else:
+            self.over = self.under = 0
+        return self.level
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.interval)
+            try:
+                self.step()
+            except Exception as e:
+                self.logger.error(f"Resource governor failed: {e}")
+
+    def metrics(self) -> dict:
+        seconds = list(self.level_seconds)
+        seconds[self.level] += time.monotonic() - self.level_since
+        names = ["normal"] + [name for name, _ in self.levels]
+        return {
+            "level": self.level,
+            "level_name": self.level_name,
+            "cpu_percent": round(self.cpu, 2),
+            "rss_mb": round(self.rss / 2 ** 20, 1),
+            "level_changes": self.changes,
+            "seconds_per_level": {name: round(s, 1) for name, s in zip(names, seconds)},
+        }
+
+
+# Headless simulation
+
+class _SimulatedPipeline:
+    """
+    Stand-in for the capture service driven by synthetic events. The real
+    ``degradation_levels`` act on stub mouse/window captures, and the
+    pipeline honours their ``move_interval``/``window_poll_interval`` the
+    way the capture service does. Every event is logged (to a null handler)
+    while its logger is enabled for INFO, and busy work stands in for the
+    per-event feature work that can be deferred.
+    """
+    def __init__(self, cfg: dict, work_us: float):
+        self.work_us = work_us
+        self.logger = logging.getLogger("governor-sim.pipeline")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            self.logger.addHandler(logging.NullHandler())
+        self.mouse = SimpleNamespace(move_interval=0.0)
+        self.window = SimpleNamespace(window_poll_interval=float(cfg["capture"].get("window_poll_interval", 0.5)))
+        self.last_move = 0.0
+        self.last_poll = 0.0
+        self.defer = False
+        self.deferred = 0
+        self.processed = 0
+
+    def levels(self, cfg: dict) -> list[Level]:
+        return degradation_levels(cfg, self.mouse, self.window, self.logger,
+                                  lambda on: setattr(self, "defer", on))
+
+    def _burn(self, us: float):
+        end = time.perf_counter() + us / 1e6
+        while time.perf_counter() < end:
+            pass
+
+    def __call__(self, event: tuple):
+        t, kind = event[0], event[1]
+        if kind == KIND_MOVE:
+            if self.mouse.move_interval and t - self.last_move < self.mouse.move_interval:
+                return
+            self.last_move = t
+        self.logger.info("Event %s at %.3f (%s deferred)", kind, t, self.deferred)
+        if t - self.last_poll >= self.window.window_poll_interval:
+            self.last_poll = t
+            self._burn(200)
+        if self.defer:
+            self.deferred += 1
+        else:
+            self._burn(self.work_us)
+        self.processed += 1
+
+
+def simulate(cfg: dict, phases: list[tuple[float, float]], cpu_percent: float, work_us: float,
+             interval: float = 0.5) -> list[dict]:
+    """
+    Feed synthetic events through the simulated pipeline while the governor samples this process
+    :param cfg: configuration, its ``governor`` keys parametrize the degradation levels
+    :param phases: (event rate, seconds) pairs
+    :return: one metrics snapshot per governor sample
+    """
+    logger = logging.getLogger("governor-sim")
+    pipeline = _SimulatedPipeline(cfg, work_us)
+    governor = ResourceGovernor(
+        pipeline.levels(cfg), logger, cpu_percent=cpu_percent, rss_mb=4096,
+        interval=interval, escalate_after=2, recover_after=4,
+    )
+    timeline = []
+    start = time.monotonic()
+
+    def sample_loop(stop: threading.Event):
+        while not stop.wait(interval):
+            governor.step()
+            timeline.append({
+                "t": round(time.monotonic() - start, 1),
+                "move_interval": pipeline.mouse.move_interval,
+                "poll_interval": pipeline.window.window_poll_interval,
+                "logging": logging.getLevelName(pipeline.logger.level),
+                **governor.metrics(),
+            })
+
+    stop = threading.Event()
+    sampler = threading.Thread(target=sample_loop, args=(stop,), daemon=True)
+    sampler.start()
+    for rate, seconds in phases:
+        SyntheticEventDriver(rate).run(pipeline, seconds)
+    stop.set()
+    sampler.join()
+    return timeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless simulation of the resource governor")
+    parser.add_argument("--config", default="config.yaml", help="Configuration file path")
+    parser.add_argument("--cpu", type=float, default=12, help="CPU budget, percent of one core")
+    parser.add_argument("--work-us", type=float, default=150, help="Feature work per event, microseconds")
+    parser.add_argument("--phases", default="200:5,3000:10,200:12", help="rate:seconds,... of synthetic events")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s | %(levelname)s | %(message)s")
+    phases = [tuple(float(v) for v in phase.split(":")) for phase in args.phases.split(",")]
+    cfg = load_config(args.config)
+    print(f"{'t':>6}{'cpu %':>8}{'level':>7}{'move s':>8}{'poll s':>8}{'logging':>9}  name")
+    for snapshot in simulate(cfg, phases, args.cpu, args.work_us):
+        print(f"{snapshot['t']:>6}{snapshot['cpu_percent']:>8}{snapshot['level']:>7}"
+              f"{snapshot['move_interval']:>8.3f}{snapshot['poll_interval']:>8.2f}{snapshot['logging']:>9}"
+              f"  {snapshot['level_name']}")
+
+
+if __name__ == "__main__":
+    main()
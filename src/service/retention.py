@@ -0,0 +1,317 @@
+from __future__ import annotations
+from contextlib import closing
+from pathlib import Path
+from typing import Callable, Optional
+
+from src.utils.config import load_config, ensure_dirs
+from src.utils.logging import setup_logging
+from src.utils.segment_log import SegmentLog
+from src.utils.storage import RETIRED_AGGREGATES_SQL, aggregate_sessions, merge_aggregates
+
+import argparse, csv, json, logging, sqlite3, threading, time
+
+DAY = 86400
+
+# Child tables holding per-session aggregates, deleted together with their session
+SESSION_TABLES = ("keyboard_data", "mouse_data", "keystroke_timing", "session_features")
+# Session tables holding detailed (raw) data, expired after ``raw_days``
+RAW_TABLES = ("keystroke_timing",)
+
+ROLLUP_SQL = """
+INSERT INTO daily_rollups (
+  day, label, context, session_count, total_duration,
+  kb_sessions, sum_avg_cpm, sum_median_cpm, sum_avg_hold_time, sum_shortcut_count, sum_keystroke_count,
+  mouse_sessions, sum_avg_dx, sum_avg_dy, sum_avg_scroll_distance, sum_avg_click_interval, sum_clicks_per_minute
+)
+SELECT
+  date(s.created_at, 'unixepoch', 'localtime') AS day,
+  COALESCE(s.label, 'unlabeled'),
+  COALESCE(s.context, ''),
+  COUNT(*),
+  TOTAL(s.duration),
+  COUNT(k.session_id), TOTAL(k.avg_cpm), TOTAL(k.median_cpm), TOTAL(k.avg_hold_time),
+  TOTAL(k.shortcut_count), TOTAL(k.keystroke_count),
+  COUNT(m.session_id), TOTAL(m.avg_dx), TOTAL(m.avg_dy), TOTAL(CAST(m.avg_scroll_distance AS REAL)),
+  TOTAL(m.avg_click_interval), TOTAL(m.clicks_per_minute)
+FROM sessions s
+LEFT JOIN keyboard_data k ON k.session_id = s.session_id
+LEFT JOIN mouse_data m ON m.session_id = s.session_id
+WHERE s.created_at < :cutoff
+GROUP BY 1, 2, 3
+ON CONFLICT(day, label, context) DO UPDATE SET
+  session_count = session_count + excluded.session_count,
+  total_duration = total_duration + excluded.total_duration,
+  kb_sessions = kb_sessions + excluded.kb_sessions,
+  sum_avg_cpm = sum_avg_cpm + excluded.sum_avg_cpm,
+  sum_median_cpm = sum_median_cpm + excluded.sum_median_cpm,
+  sum_avg_hold_time = sum_avg_hold_time + excluded.sum_avg_hold_time,
+  sum_shortcut_count = sum_shortcut_count + excluded.sum_shortcut_count,
+  sum_keystroke_count = sum_keystroke_count + excluded.sum_keystroke_count,
+  mouse_sessions = mouse_sessions + excluded.mouse_sessions,
+  sum_avg_dx = sum_avg_dx + excluded.sum_avg_dx,
+  sum_avg_dy = sum_avg_dy + excluded.sum_avg_dy,
+  sum_avg_scroll_distance = sum_avg_scroll_distance + excluded.sum_avg_scroll_distance,
+  sum_avg_click_interval = sum_avg_click_interval + excluded.sum_avg_click_interval,
+  sum_clicks_per_minute = sum_clicks_per_minute + excluded.sum_clicks_per_minute
+"""
+
+
+class RetentionManager:
+    """
+    Applies the retention policies of the ``retention`` config section:
+
+    - raw data (``raw_dir`` exports, raw event segments, keystroke timing histograms) is kept ``raw_days``
+    - per-session aggregates are kept ``session_months``, then rolled up into ``daily_rollups``
+    - daily rollups are kept ``rollup_days`` (forever when unset)
+
+    Compaction (incremental vacuum + WAL checkpoint) only runs while the user is idle.
+    """
+    def __init__(self, cfg: dict, logger: logging.Logger,
+                 idle_seconds: Optional[Callable[[], float]] = None):
+        retention = cfg.get("retention", {})
+        self.db_path = Path(cfg["paths"]["db_path"])
+        self.raw_dir = Path(cfg["paths"]["raw_dir"])
+        self.segments = SegmentLog(cfg["paths"]["segments_dir"]) if cfg["paths"].get("segments_dir") else None
+        self.logger = logger
+        self.idle_seconds = idle_seconds
+
+        self.raw_days: float = float(retention.get("raw_days", 30))
+        self.session_days: float = float(retention.get("session_months", 6)) * 30
+        rollup_days = retention.get("rollup_days")
+        self.rollup_days: Optional[float] = float(rollup_days) if rollup_days is not None else None
+        self.idle_threshold: float = float(retention.get("idle_seconds", 300))
+        self.check_interval: float = float(retention.get("check_interval", 60))
+        self.enforce_interval: float = float(retention.get("enforce_interval", 3600))
+        self.vacuum_pages: int = int(retention.get("vacuum_pages", 256))
+
+        self.last_enforced: float = 0
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+    # Background loop
+
+    def start(self):
+        """Start the maintenance loop in a daemon thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.logger.info("Retention manager started")
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.check_interval)
+            try:
+                if self.is_idle():
+                    self.run_once()
+            except Exception as e:
+                self.logger.error(f"Retention maintenance failed: {e}")
+
+    def is_idle(self) -> bool:
+        """True when no input has been seen for ``idle_seconds``"""
+        if self.idle_seconds is None:
+            return True
+        return self.idle_seconds() >= self.idle_threshold
+
+    def run_once(self, now: Optional[float] = None):
+        """Enforce policies (at most every ``enforce_interval``) and compact"""
+        now = now or time.time()
+        if now - self.last_enforced >= self.enforce_interval:
+            self.enforce(now)
+            self.last_enforced = now
+        self.compact()
+
+    # Policies
+
+    def _cutoffs(self, now: float) -> dict:
+        return {
+            "raw": now - self.raw_days * DAY,
+            "session": now - self.session_days * DAY,
+            "rollup": now - self.rollup_days * DAY if self.rollup_days is not None else None,
+        }
+
+    @staticmethod
+    def _table_cutoff(table: str, cutoffs: dict) -> float:
+        """Raw tables expire at the raw cutoff, or earlier together with their session"""
+        if table in RAW_TABLES:
+            return max(cutoffs["raw"], cutoffs["session"])
+        return cutoffs["session"]
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA foreign_keys = ON;")
+        return conn
+
+    def _expired_raw_files(self, conn: sqlite3.Connection, raw_cutoff: float, session_cutoff: float) -> list[Path]:
+        """
+        Export files older than the raw cutoff. A file is only expired once none of
+        its sessions remain in the DB, otherwise the exporter would upload them again.
+        """
+        if not self.raw_dir.exists():
+            return []
+        kept_sessions = {
+            sid for (sid,) in conn.execute(
+                "SELECT session_id FROM sessions WHERE created_at >= ?", (session_cutoff,)
+            )
+        }
+        expired = []
+        for path in sorted(self.raw_dir.glob("*.csv")):
+            if path.stat().st_mtime >= raw_cutoff:
+                continue
+            with path.open(newline="", encoding="utf-8") as f:
+                if any(row.get("session_id") in kept_sessions for row in csv.DictReader(f)):
+                    continue
+            expired.append(path)
+        return expired
+
+    def plan(self, now: Optional[float] = None) -> dict:
+        """
+        Dry-run report of what ``enforce`` and ``compact`` would remove and the space reclaimed
+        :param now: reference time, defaults to the current time
+        :return: report dictionary
+        """
+        now = now or time.time()
+        cutoffs = self._cutoffs(now)
+
+        with closing(self._connect()) as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            table_bytes = self._table_bytes(conn, page_size)
+
+            rows = {
+                "sessions": conn.execute(
+                    "SELECT COUNT(*) FROM sessions WHERE created_at < ?", (cutoffs["session"],)
+                ).fetchone()[0],
+            }
+            for table in SESSION_TABLES:
+                rows[table] = conn.execute(
+                    f"SELECT COUNT(*) FROM {table} t JOIN sessions s ON s.session_id = t.session_id "
+                    f"WHERE s.created_at < ?", (self._table_cutoff(table, cutoffs),)
+                ).fetchone()[0]
+            rows["daily_rollups"] = conn.execute(
+                "SELECT COUNT(*) FROM daily_rollups WHERE day < date(?, 'unixepoch', 'localtime')",
+                (cutoffs["rollup"],)
+            ).fetchone()[0] if cutoffs["rollup"] is not None else 0
+
+            db_bytes = 0
+            for table, n in rows.items():
+                total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                if total:
+                    db_bytes += int(table_bytes.get(table, 0) * n / total)
+
+            raw_files = self._expired_raw_files(conn, cutoffs["raw"], cutoffs["session"])
+
+        segments = self.segments.expired(cutoffs["raw"]) if self.segments else []
+        wal_path = self.db_path.with_name(self.db_path.name + "-wal")
+        return {
+            "cutoffs": {k: v and time.strftime("%Y-%m-%d %H:%M", time.localtime(v)) for k, v in cutoffs.items()},
+            "rows": rows,
+            "raw_files": [str(p) for p in raw_files],
+            "raw_segments": len(segments),
+            "reclaimable_bytes": {
+                "rows": db_bytes,
+                "freelist": freelist * page_size,
+                "wal": wal_path.stat().st_size if wal_path.exists() else 0,
+                "raw_files": sum(p.stat().st_size for p in raw_files),
+                "raw_segments": sum(p.stat().st_size for p in segments),
+            },
+        }
+
+    @staticmethod
+    def _table_bytes(conn: sqlite3.Connection, page_size: int) -> dict:
+        """Bytes used per table, from dbstat when compiled in, else spread evenly by row count"""
+        try:
+            return dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+        except sqlite3.OperationalError:
+            used = (conn.execute("PRAGMA page_count").fetchone()[0]
+                    - conn.execute("PRAGMA freelist_count").fetchone()[0]) * page_size
+            tables = [name for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+            )]
+            counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in tables}
+            total = sum(counts.values()) or 1
+            return {t: used * n / total for t, n in counts.items()}
+
+    def enforce(self, now: Optional[float] = None) -> dict:
+        """
+        Roll up and delete expired data
+        :param now: reference time, defaults to the current time
+        :return: number of deleted rows per table
+        """
+        now = now or time.time()
+        cutoffs = self._cutoffs(now)
+        deleted = {}
+
+        with closing(self._connect()) as conn:
+            conn.executescript(RETIRED_AGGREGATES_SQL)
+            with conn:
+                conn.execute(ROLLUP_SQL, {"cutoff": cutoffs["session"]})
+                # label_aggregates keeps counting the expired sessions; record their share
+                # so that rebuilding the aggregates from the remaining sessions keeps it too
+                retired, _ = aggregate_sessions(conn, "WHERE s.created_at < ?", (cutoffs["session"],))
+                merge_aggregates(conn, "retired_aggregates", retired)
+                expired = "SELECT session_id FROM sessions WHERE created_at < ?"
+                for table in SESSION_TABLES:
+                    deleted[table] = conn.execute(
+                        f"DELETE FROM {table} WHERE session_id IN ({expired})",
+                        (self._table_cutoff(table, cutoffs),)
+                    ).rowcount
+                deleted["sessions"] = conn.execute(
+                    "DELETE FROM sessions WHERE created_at < ?", (cutoffs["session"],)
+                ).rowcount
+                if cutoffs["rollup"] is not None:
+                    deleted["daily_rollups"] = conn.execute(
+                        "DELETE FROM daily_rollups WHERE day < date(?, 'unixepoch', 'localtime')",
+                        (cutoffs["rollup"],)
+                    ).rowcount
+
+            raw_files = self._expired_raw_files(conn, cutoffs["raw"], cutoffs["session"])
+
+        for path in raw_files:
+            path.unlink(missing_ok=True)
+        deleted["raw_files"] = len(raw_files)
+
+        segments = self.segments.expired(cutoffs["raw"]) if self.segments else []
+        for path in segments:
+            self.segments.delete(path)
+        deleted["raw_segments"] = len(segments)
+
+        self.logger.info(f"Retention enforced: {deleted}")
+        return deleted
+
+    def compact(self) -> None:
+        """Reclaim up to ``vacuum_pages`` free pages and truncate the WAL"""
+        with closing(self._connect()) as conn:
+            # Without incremental auto_vacuum (enabled by EventStore.create_schema) this only truncates the WAL
+            freed = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute(f"PRAGMA incremental_vacuum({self.vacuum_pages})").fetchall()
+            busy, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            self.logger.debug(
+                f"Compacted {min(freed, self.vacuum_pages)} pages, checkpoint {'busy' if busy else 'done'}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply data retention policies")
+    parser.add_argument("--config", default="config.yaml", help="Configuration file path")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+    args = parser.parse_args()
+
+    cfg = load_config(args.config)
+    ensure_dirs(cfg)
+    logger = setup_logging(cfg["paths"]["logs_dir"])
+
+    manager = RetentionManager(cfg, logger)
+    if args.dry_run:
+        logger.info("Retention dry run:\n" + json.dumps(manager.plan(), indent=2))
+    else:
+        manager.enforce()
+        manager.compact()
+
+
+if __name__ == "__main__":
+    main()
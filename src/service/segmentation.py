@@ -0,0 +1,101 @@
+from __future__ import annotations
+from typing import Optional, Tuple
+
+# (reason, end time of the current session, next context, start of the next session or None while idle)
+Split = Tuple[str, float, Optional[str], Optional[float]]
+
+
+class Segmenter:
+    """
+    Decides where sessions start and end.
+
+    - A context change only splits once the new context has lasted ``merge_gap``
+      seconds, so alt-tab flickers and brief returns stay in the current session.
+      The split is dated at the switch, but the input of those ``merge_gap``
+      seconds is already in the ending session's aggregates, which cannot be
+      cut by time: boundaries are approximate by up to ``merge_gap``.
+    - ``idle_gap`` seconds without input close the session at the last input;
+      the next one starts when input resumes.
+    - Sessions are split every ``max_duration`` seconds.
+    - Sessions shorter than ``min_duration`` or with fewer than ``min_events``
+      events are held back and carried into the next session (see ``hold_back``).
+    """
+    def __init__(self, min_duration: float = 5, min_events: int = 10, merge_gap: float = 3,
+                 idle_gap: float = 300, max_duration: float = 3600):
+        self.min_duration = min_duration
+        self.min_events = min_events
+        self.merge_gap = merge_gap
+        self.idle_gap = idle_gap
+        self.max_duration = max_duration
+
+        self.context: Optional[str] = None
+        self.start: Optional[float] = None
+        self.pending: Optional[Tuple[str, float]] = None
+        self.idle_since: Optional[float] = None
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "Segmenter":
+        seg = cfg.get("segmentation", {})
+        return cls(
+            min_duration=float(seg.get("min_duration", 5)),
+            min_events=int(seg.get("min_events", 10)),
+            merge_gap=float(seg.get("merge_gap", 3)),
+            idle_gap=float(seg.get("idle_gap", 300)),
+            max_duration=float(seg.get("max_duration", 3600)),
+        )
+
+    @property
+    def is_idle(self) -> bool:
+        return self.idle_since is not None
+
+    def begin(self, context: str, start: float):
+        """A new session is open"""
+        self.context = context
+        self.start = start
+        self.pending = None
+        self.idle_since = None
+
+    def observe(self, context: str, now: float):
+        """Record the foreground context reported by the window poller"""
+        if self.is_idle or self.context is None:
+            self.context = context
+        elif context == self.context:
+            self.pending = None
+        elif self.pending is None:
+            self.pending = (context, now)
+        else:
+            # A -> B -> C: the session still ends when A was left
+            self.pending = (context, self.pending[1])
+
+    def tick(self, now: float, last_input: float) -> Optional[Split]:
+        """
+        Check the split conditions
+        :param now: current time
+        :param last_input: time of the last keyboard/mouse event
+        :return: a ``Split`` when the current session should end, else None
+        """
+        if self.start is None or self.is_idle:
+            return None
+        if self.pending is not None and now - self.pending[1] >= self.merge_gap:
+            context, switched_at = self.pending
+            return "switch", switched_at, context, switched_at
+        if now - max(last_input, self.start) >= self.idle_gap:
+            return "idle", max(last_input, self.start), self.context, None
+        if now - self.start >= self.max_duration:
+            return "max_duration", now, self.context, now
+        return None
+
+    def mark_idle(self, since: float):
+        self.idle_since = since
+        self.start = None
+        self.pending = None
+
+    def resume(self, last_input: float) -> Optional[float]:
+        """Start time of the next session once input resumed after an idle split"""
+        if self.is_idle and last_input > self.idle_since:
+            return last_input
+        return None
+
+    def hold_back(self, duration: float, events: int) -> bool:
+        """True when a session is too small to be written on its own"""
+        return duration < self.min_duration or events < self.min_events
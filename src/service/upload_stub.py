@@ -0,0 +1,245 @@
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+import random
+
+from src.features.keystroke_timing import TimingMatrix
+from src.service.export import BUNDLE_MANIFEST, Exporter
+from src.utils.storage import EventStore
+
+import argparse, csv, hashlib, io, json, logging, sqlite3, tempfile, threading, time, uuid, zipfile
+
+
+class UploadStub(ThreadingHTTPServer):
+    """
+    Local stand-in for the upload server: presign, upload and known-session
+    endpoints. Uploads are verified against their presigned size and SHA256,
+    bundles also part by part against their manifest, and the session ids
+    received are remembered per label. Counts requests and bytes on the wire.
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, bandwidth: float = 0.0):
+        """
+        :param latency: seconds added to every response, as a network round-trip
+        :param bandwidth: upload bytes per second simulated on request bodies, 0 for unlimited
+        """
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.lock = threading.Lock()
+        self.presigned: dict[str, dict] = {}
+        self.known: dict[str, set[str]] = {}
+        self.requests = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.uploads = 0
+        self.duplicates = 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "UploadStub":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def reset(self, forget_sessions: bool = True):
+        """Zero the counters (and the sessions received)"""
+        with self.lock:
+            self.requests = self.bytes_received = self.bytes_sent = self.uploads = self.duplicates = 0
+            if forget_sessions:
+                self.known.clear()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+            "uploads": self.uploads,
+            "sessions": sum(len(ids) for ids in self.known.values()),
+            "duplicate_sessions": self.duplicates,
+        }
+
+    def receive(self, label: str, body: bytes, file_name: str) -> None:
+        """Record the session ids of an uploaded CSV or bundle, raises ValueError when a part does not match"""
+        if file_name.endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(body)) as bundle:
+                manifest = json.loads(bundle.read(BUNDLE_MANIFEST))
+                session_ids = []
+                for part in manifest["parts"]:
+                    data = bundle.read(part["name"])
+                    if len(data) != part["size"] or hashlib.sha256(data).hexdigest() != part["sha256"]:
+                        raise ValueError(f"Part {part['name']} does not match the manifest")
+                    session_ids += part["session_ids"]
+        else:
+            session_ids = [row["session_id"] for row in csv.DictReader(io.StringIO(body.decode("utf-8")))]
+        with self.lock:
+            known = self.known.setdefault(label, set())
+            self.duplicates += sum(session_id in known for session_id in session_ids)
+            known.update(session_ids)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: UploadStub
+    protocol_version = "HTTP/1.1"
+
+    def _body(self) -> bytes:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        # Request line and headers count as bytes on the wire too
+        head = len(self.requestline) + 2 + sum(len(k) + len(v) + 4 for k, v in self.headers.items()) + 2
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.bytes_received += head + len(body)
+        if self.server.bandwidth:
+            time.sleep((head + len(body)) / self.server.bandwidth)
+        return body
+
+    def _reply(self, status: int, payload: Optional[dict] = None):
+        data = json.dumps(payload or {}).encode()
+        time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        with self.server.lock:
+            self.server.bytes_sent += len(data)
+
+    def do_POST(self):
+        request = json.loads(self._body() or b"{}")
+        if self.path == "/api/presign":
+            token = uuid.uuid4().hex
+            with self.server.lock:
+                self.server.presigned[token] = request
+            self._reply(200, {"upload_url": f"{self.server.base_url}/upload/{token}", "token": token})
+        elif self.path == "/api/sessions/known":
+            known = self.server.known.get(request.get("label"), set())
+            self._reply(200, {"known": [sid for sid in request.get("session_ids", []) if sid in known]})
+        else:
+            self._reply(404)
+
+    def do_PUT(self):
+        body = self._body()
+        token = self.path.rsplit("/", 1)[-1]
+        with self.server.lock:
+            presign = self.server.presigned.pop(token, None)
+        if (presign is None or self.headers.get("Authorization") != f"Bearer {token}"
+                or len(body) != presign["size"] or hashlib.sha256(body).hexdigest() != presign["checksum"]):
+            self._reply(400, {"error": "upload does not match its presign"})
+            return
+        try:
+            self.server.receive(presign["label"], body, presign["file_name"])
+        except (ValueError, KeyError, zipfile.BadZipFile) as e:
+            self._reply(400, {"error": str(e)})
+            return
+        with self.server.lock:
+            self.server.uploads += 1
+        self._reply(200)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Benchmark
+
+def _record_sessions(store: EventStore, rng: random.Random, count: int):
+    """Store ``count`` sessions with random summary columns and timing histograms"""
+    for _ in range(count):
+        session_id = uuid.uuid4().hex
+        store.upsert_session(session_id, context=rng.choice(["editor", "browser", "terminal"]),
+                             duration=rng.uniform(60, 600))
+        store.upsert_kb_data(session_id, avg_cpm=rng.uniform(100, 400), median_cpm=rng.uniform(100, 400),
+                             avg_hold_time=rng.uniform(0.05, 0.2), shortcut_count=rng.randint(0, 50),
+                             keystroke_count=rng.randint(50, 5000))
+        store.upsert_mouse_data(session_id, avg_dx=rng.uniform(0, 20), avg_dy=rng.uniform(0, 20),
+                                avg_scroll_distance=rng.uniform(0, 10), avg_click_interval=rng.uniform(0.5, 10),
+                                clicks_per_minute=rng.uniform(1, 60))
+        dwell, flight = TimingMatrix(), TimingMatrix()
+        for _ in range(rng.randint(50, 500)):
+            dwell.add(rng.randrange(25), rng.lognormvariate(-2.3, 0.4))
+            flight.add(rng.randrange(25), rng.lognormvariate(-1.6, 0.6))
+        store.upsert_kb_timing(session_id, dwell, flight)
+
+
+def run_benchmark(exports: int, sessions: int, latency: float = 0.05, bandwidth: float = 1.25e6,
+                  seed: int = 0) -> list[dict]:
+    """
+    Upload ``exports`` small CSV exports of ``sessions`` sessions each to a
+    local stub, one by one and then as bundles, and again as bundles with
+    the ledger lost (every session already on the server)
+    """
+    logging.disable(logging.WARNING)
+    rng = random.Random(seed)
+    stub = UploadStub(latency=latency, bandwidth=bandwidth).start()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = {
+            "paths": {"db_path": f"{tmp}/db.sqlite", "raw_dir": f"{tmp}/raw", "logs_dir": f"{tmp}/logs"},
+            "session_label": "bench",
+            "base_url": stub.base_url,
+        }
+        Path(cfg["paths"]["raw_dir"]).mkdir()
+        store = EventStore(cfg["paths"]["db_path"], logging.getLogger("bench"), cfg["session_label"])
+        store.create_schema()
+        exporter = Exporter(cfg)
+        paths = []
+        for _ in range(exports):
+            _record_sessions(store, rng, sessions)
+            path, _ = exporter.export_to_csv()
+            paths.append(path)
+        store.close()
+        csv_bytes = sum(path.stat().st_size for path in paths)
+
+        def measure(mode: str, upload):
+            stub.reset(forget_sessions=mode != "bundle, all known")
+            start = time.perf_counter()
+            upload()
+            results.append({"mode": mode, "seconds": round(time.perf_counter() - start, 3), **stub.stats()})
+
+        measure("csv per export", lambda: [exporter.upload_to_server(path) for path in paths])
+        measure("bundle", exporter.upload_bundles)
+        # A lost ledger (or another machine) bundles the same exports again
+        with sqlite3.connect(cfg["paths"]["db_path"]) as conn:
+            conn.execute("DELETE FROM export_bundles")
+        measure("bundle, all known", exporter.upload_bundles)
+    stub.stop()
+    logging.disable(logging.NOTSET)
+    for result in results:
+        result["csv_bytes"] = csv_bytes
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local upload server stand-in and export upload benchmark")
+    parser.add_argument("--serve", action="store_true", help="Run the stub until interrupted")
+    parser.add_argument("--port", type=int, default=8765, help="Port of --serve")
+    parser.add_argument("--exports", type=int, default=40, help="Benchmark: number of CSV exports")
+    parser.add_argument("--sessions", type=int, default=5, help="Benchmark: sessions per export")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Simulated round-trip per request")
+    parser.add_argument("--mbps", type=float, default=10, help="Simulated upload bandwidth, Mbit/s (0: unlimited)")
+    args = parser.parse_args()
+
+    if args.serve:
+        stub = UploadStub(port=args.port, latency=args.latency_ms / 1000, bandwidth=args.mbps * 125_000)
+        print(f"Upload stub on {stub.base_url} (set base_url to it)")
+        stub.serve_forever()
+        return
+
+    results = run_benchmark(args.exports, args.sessions, args.latency_ms / 1000, args.mbps * 125_000)
+    print(f"{args.exports} exports x {args.sessions} sessions, {results[0]['csv_bytes']:,} bytes of CSV, "
+          f"{args.latency_ms:g} ms round-trip, {args.mbps:g} Mbit/s up")
+    print(f"{'mode':<20}{'requests':>10}{'bytes up':>12}{'bytes down':>12}{'uploads':>9}{'sessions':>10}{'dupes':>7}{'seconds':>9}")
+    for r in results:
+        print(f"{r['mode']:<20}{r['requests']:>10}{r['bytes_received']:>12,}{r['bytes_sent']:>12,}{r['uploads']:>9}"
+              f"{r['sessions']:>10}{r['duplicate_sessions']:>7}{r['seconds']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,3 +9,6 @@ def load_config(path: str | Path) -> dict:
 def ensure_dirs(cfg: dict):
     for key in ("data_dir","raw_dir","interim_dir","processed_dir","models_dir","logs_dir"):
         Path(cfg["paths"][key]).mkdir(parents=True, exist_ok=True)
+    # Only needed when raw events are recorded
+    if cfg["paths"].get("segments_dir"):
+        Path(cfg["paths"]["segments_dir"]).mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,10 @@
+# Raw input event kinds shared by the segment log and the hook process ring buffer
+KIND_KEY_DOWN = 1
+KIND_KEY_UP = 2
+KIND_MOVE = 3
+KIND_CLICK_DOWN = 4
+KIND_CLICK_UP = 5
+KIND_SCROLL = 6
+
+# Mouse buttons by pynput ``Button`` name
+BUTTON_CODES = {"left": 1, "right": 2, "middle": 3}
@@ -0,0 +1,343 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterator, Optional
+import numpy as np
+
+from src.utils.events import KIND_MOVE
+
+import argparse, json, logging, os, queue, struct, threading, time
+
+# One fixed-size record per raw input event (24 bytes)
+RECORD_DTYPE = np.dtype([
+    ("t", "<f8"),          # event time (epoch seconds), non-decreasing within a segment
+    ("session", "<u4"),    # index into the segment's session table, NO_SESSION before the first session
+    ("kind", "u1"),        # one of the src.utils.events KIND_* constants
+    ("flags", "u1"),
+    ("code", "<u2"),       # key class for key events, button for clicks
+    ("x", "<i4"),          # pointer position, or scroll dx for scroll events
+    ("y", "<i4"),          # pointer position, or scroll dy for scroll events
+])
+RECORD_SIZE = RECORD_DTYPE.itemsize
+# Session slot of events recorded before any session was set
+NO_SESSION = 0xFFFFFFFF
+
+
+MAGIC = b"BEHAVSEG"
+VERSION = 1
+HEADER = struct.Struct("<8sHH20x")
+HEADER_SIZE = HEADER.size
+
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+
+
+def _index_path(segment_path: Path) -> Path:
+    return segment_path.with_suffix(INDEX_SUFFIX)
+
+
+def _write_index(segment_path: Path, index: dict) -> None:
+    """Atomically replace the index of a segment"""
+    path = _index_path(segment_path)
+    tmp = path.with_suffix(INDEX_SUFFIX + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp, path)
+
+
+def read_index(segment_path: Path) -> dict:
+    path = _index_path(segment_path)
+    if not path.exists():
+        return {"t_min": None, "t_max": None, "count": 0, "sessions": [], "closed": False}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def recover_segment(segment_path: Path, logger: Optional[logging.Logger] = None) -> dict:
+    """
+    Truncate a torn tail record and bring the index in line with the data
+    :param segment_path: segment file
+    :param logger: optional logger
+    :return: up-to-date index
+    """
+    index = read_index(segment_path)
+    size = segment_path.stat().st_size
+    with open(segment_path, "rb") as f:
+        magic, version, record_size = HEADER.unpack(f.read(HEADER_SIZE))
+    if magic != MAGIC or record_size != RECORD_SIZE:
+        raise ValueError(f"{segment_path} is not a v{VERSION} segment file")
+
+    count, torn = divmod(size - HEADER_SIZE, RECORD_SIZE)
+    if torn:
+        with open(segment_path, "r+b") as f:
+            f.truncate(HEADER_SIZE + count * RECORD_SIZE)
+        if logger:
+            logger.warning(f"Truncated torn record ({torn} bytes) in {segment_path.name}")
+
+    if torn or index["count"] != count:
+        records = np.memmap(segment_path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,)) \
+            if count else np.empty(0, RECORD_DTYPE)
+        index["count"] = count
+        index["t_min"] = float(records["t"][0]) if count else None
+        index["t_max"] = float(records["t"][-1]) if count else None
+        del records
+    index["closed"] = True
+    _write_index(segment_path, index)
+    return index
+
+
+class SegmentWriter:
+    """
+    Append-only raw event log split in fixed-record segment files.
+
+    Events are buffered in a preallocated structured array by the hook
+    threads; full batches (or every ``flush_interval``) are handed to a
+    writer thread, so file writes, index updates and rotation never run on
+    an input hook. Segments rotate once they exceed ``max_bytes`` or are
+    older than ``max_seconds``; each has a small JSON index with its time
+    range and session ids. Segments left open by a crash are recovered
+    when the writer starts.
+    """
+    def __init__(self, directory: str | Path, logger: logging.Logger,
+                 max_bytes: int = 64 * 1024 * 1024, max_seconds: float = 3600,
+                 batch_size: int = 4096, flush_interval: float = 1.0):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.logger = logger
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.flush_interval = flush_interval
+
+        self.lock = threading.Lock()
+        self.buffer = np.zeros(batch_size, dtype=RECORD_DTYPE)
+        self.buffered = 0
+        self.last_flush: float = time.time()
+        self.last_t: float = 0
+
+        # Buffered records carry writer-wide session numbers, mapped to segment slots when written
+        self.session_id: Optional[str] = None
+        self.session_number: int = NO_SESSION
+        self.sessions: list[str] = []
+
+        # Owned by the writer thread
+        self.file = None
+        self.path: Optional[Path] = None
+        self.index: dict = {}
+        self.session_slots: dict = {}
+        self.opened_at: float = 0
+
+        for path in SegmentLog(self.directory).segments():
+            if not read_index(path).get("closed"):
+                recover_segment(path, self.logger)
+
+        self.batches: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _open_segment(self, now: float):
+        self.path = self.directory / f"segment-{int(now * 1000):015d}{SEGMENT_SUFFIX}"
+        self.file = open(self.path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD_SIZE))
+        self.file.flush()
+        self.index = {"t_min": None, "t_max": None, "count": 0, "sessions": [], "closed": False}
+        self.session_slots = {}
+        self.opened_at = now
+        _write_index(self.path, self.index)
+        self.logger.debug(f"Opened raw segment {self.path.name}")
+
+    def _session_slot(self, session_id: str) -> int:
+        slot = self.session_slots.get(session_id)
+        if slot is None:
+            slot = len(self.index["sessions"])
+            self.index["sessions"].append(session_id)
+            self.session_slots[session_id] = slot
+        return slot
+
+    def set_session(self, session_id: str):
+        """Attribute subsequent events to ``session_id``"""
+        with self.lock:
+            self.session_id = session_id
+            if session_id in self.sessions:
+                self.session_number = self.sessions.index(session_id)
+            else:
+                self.session_number = len(self.sessions)
+                self.sessions.append(session_id)
+
+    def append(self, t: float, kind: int, code: int = 0, x: float = 0, y: float = 0):
+        """Buffer one event; the batch is handed to the writer thread when full or ``flush_interval`` elapsed"""
+        with self.lock:
+            # Hooks run on several threads, keep timestamps sorted for binary search
+            if t < self.last_t:
+                t = self.last_t
+            self.last_t = t
+
+            self.buffer[self.buffered] = (t, self.session_number, kind, 0, code, int(x), int(y))
+            self.buffered += 1
+
+            if self.buffered == len(self.buffer) or t - self.last_flush >= self.flush_interval:
+                self._hand_off(t)
+
+    def _hand_off(self, now: float):
+        if self.buffered:
+            self.batches.put(self.buffer[:self.buffered].copy())
+            self.buffered = 0
+        self.last_flush = now
+
+    def _run(self):
+        while True:
+            batch = self.batches.get()
+            try:
+                if batch is None:
+                    if self.file is not None:
+                        self._close_segment()
+                    return
+                self._write(batch)
+            except Exception as e:
+                self.logger.error(f"Raw event log write failed: {e}")
+            finally:
+                self.batches.task_done()
+
+    def _write(self, batch: np.ndarray):
+        if self.file is None:
+            self._open_segment(float(batch["t"][0]))
+        # Writer-wide session numbers -> slots of this segment, records without a session keep NO_SESSION
+        sessions = list(self.sessions)
+        numbers = batch["session"].astype(np.int64)
+        numbers[numbers == NO_SESSION] = len(sessions)
+        slots = np.full(len(sessions) + 1, NO_SESSION, dtype=np.uint32)
+        known = len(self.index["sessions"])
+        for number in np.unique(numbers):
+            if number < len(sessions):
+                slots[number] = self._session_slot(sessions[number])
+        batch["session"] = slots[numbers]
+        if len(self.index["sessions"]) > known:
+            # Session ids are written before their records so a crash never leaves unresolvable records
+            _write_index(self.path, self.index)
+
+        self.file.write(batch.tobytes())
+        self.file.flush()
+        if self.index["t_min"] is None:
+            self.index["t_min"] = float(batch["t"][0])
+        self.index["t_max"] = float(batch["t"][-1])
+        self.index["count"] += len(batch)
+        _write_index(self.path, self.index)
+
+        if self.file.tell() >= self.max_bytes or self.index["t_max"] - self.opened_at >= self.max_seconds:
+            self._close_segment()
+
+    def _close_segment(self):
+        self.file.close()
+        self.index["closed"] = True
+        _write_index(self.path, self.index)
+        self.logger.debug(f"Closed raw segment {self.path.name} ({self.index['count']} events)")
+        self.file = None
+
+    def flush(self):
+        """Hand off the buffered events and wait until everything is written"""
+        with self.lock:
+            self._hand_off(time.time())
+        self.batches.join()
+
+    def close(self):
+        with self.lock:
+            self._hand_off(time.time())
+            self.batches.put(None)
+        self.thread.join()
+
+
+class SegmentLog:
+    """
+    Reader over a directory of segments. Segments are memory-mapped as
+    NumPy structured arrays, so slices are returned without copying.
+    """
+    def __init__(self, directory: str | Path, logger: Optional[logging.Logger] = None):
+        self.directory = Path(directory)
+        self.logger = logger
+
+    def segments(self) -> list[Path]:
+        return sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}"))
+
+    def open(self, path: Path) -> tuple[np.ndarray, dict]:
+        """
+        Map a segment. A torn tail of a closed segment is truncated; the segment
+        still being written is mapped up to its last complete record.
+        :param path: segment file
+        :return: (records, index)
+        """
+        count, torn = divmod(path.stat().st_size - HEADER_SIZE, RECORD_SIZE)
+        index = read_index(path)
+        if index.get("closed") and (torn or index["count"] != count):
+            index = recover_segment(path, self.logger)
+        if count == 0:
+            return np.empty(0, RECORD_DTYPE), index
+        return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,)), index
+
+    def read(self, t_start: Optional[float] = None, t_end: Optional[float] = None,
+             session_id: Optional[str] = None) -> Iterator[tuple[np.ndarray, dict]]:
+        """
+        Yield (records, index) for every segment overlapping [t_start, t_end).
+        Time slicing is zero-copy; filtering by session returns a copy.
+        """
+        for path in self.segments():
+            index = read_index(path)
+            # The open segment's index may lag behind its data
+            if index.get("closed") and t_start is not None and (index["t_max"] or 0) < t_start:
+                continue
+            if index["t_min"] is not None and t_end is not None and index["t_min"] >= t_end:
+                continue
+            if session_id is not None and session_id not in index["sessions"]:
+                continue
+
+            records, index = self.open(path)
+            if not len(records):
+                continue
+            lo = np.searchsorted(records["t"], t_start, side="left") if t_start is not None else 0
+            hi = np.searchsorted(records["t"], t_end, side="left") if t_end is not None else len(records)
+            records = records[lo:hi]
+            if session_id is not None:
+                records = records[records["session"] == index["sessions"].index(session_id)]
+            if len(records):
+                yield records, index
+
+    def expired(self, cutoff: float) -> list[Path]:
+        """Closed segments whose newest event is older than ``cutoff``"""
+        return [
+            path for path in self.segments()
+            if (index := read_index(path)).get("closed") and (index["t_max"] or 0) < cutoff
+        ]
+
+    @staticmethod
+    def delete(path: Path):
+        path.unlink(missing_ok=True)
+        _index_path(path).unlink(missing_ok=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raw event segment log benchmark")
+    parser.add_argument("--dir", default="data/segments_bench", help="Directory for the benchmark segments")
+    parser.add_argument("--events", type=int, default=86_400_000 // 10, help="Number of synthetic events")
+    args = parser.parse_args()
+
+    logger = logging.getLogger("segment-bench")
+    writer = SegmentWriter(args.dir, logger)
+    writer.set_session("bench")
+
+    start = time.perf_counter()
+    t0 = time.time()
+    for i in range(args.events):
+        writer.append(t0 + i * 0.001, KIND_MOVE, 0, i % 1920, i % 1080)
+    writer.close()
+    write_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    total, distance = 0, 0.0
+    for records, _ in SegmentLog(args.dir).read(t0, t0 + 86400):
+        total += len(records)
+        distance += float(np.abs(np.diff(records["x"].astype(np.int64))).sum())
+    replay_s = time.perf_counter() - start
+
+    print(f"wrote {args.events} events in {write_s:.2f}s ({args.events / write_s:,.0f}/s)")
+    print(f"replayed {total} events in {replay_s:.2f}s ({total / max(replay_s, 1e-9):,.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
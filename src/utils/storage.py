@@ -1,9 +1,13 @@
 from __future__ import annotations
 import sqlite3
 from pathlib import Path
-import logging
+import json, logging, time
+
+from src.features.column_stats import ColumnAggregate, COLUMN_BIN_EDGES
+from src.features.keystroke_timing import TimingMatrix, N_CLASSES, N_BINS
 
 SCHEMA_SQL = """
+PRAGMA auto_vacuum=INCREMENTAL;
 PRAGMA journal_mode=WAL;
 PRAGMA synchronous=NORMAL;
 
@@ -11,7 +15,10 @@ CREATE TABLE IF NOT EXISTS sessions (
   session_id TEXT UNIQUE NOT NULL PRIMARY KEY,
   context TEXT,             
   duration REAL,
-  label TEXT DEFAULT 'unlabeled'
+  label TEXT DEFAULT 'unlabeled',
+  created_at REAL,
+  started_at REAL,
+  ended_at REAL
 );
 
 CREATE TABLE IF NOT EXISTS keyboard_data (
@@ -32,10 +39,227 @@ CREATE TABLE IF NOT EXISTS mouse_data (
   avg_scroll_distance TEXT,
   avg_click_interval REAL,
   clicks_per_minute REAL,
+  stroke_count INTEGER,
+  avg_stroke_duration REAL,
+  avg_straightness REAL,
+  avg_curvature REAL,
+  avg_stroke_velocity REAL,
+  avg_peak_velocity_time REAL,
+  avg_acceleration REAL,
+  avg_overshoot REAL,
+  avg_click_to_target REAL,
   session_id TEXT NOT NULL,
   FOREIGN KEY(session_id) REFERENCES sessions(session_id)
 );
+
+CREATE TABLE IF NOT EXISTS keystroke_timing (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  n_classes INTEGER,
+  n_bins INTEGER,
+  dwell_hist BLOB,
+  flight_hist BLOB,
+  session_id TEXT NOT NULL,
+  FOREIGN KEY(session_id) REFERENCES sessions(session_id)
+);
+
+CREATE TABLE IF NOT EXISTS daily_rollups (
+  day TEXT NOT NULL,
+  label TEXT NOT NULL,
+  context TEXT NOT NULL,
+  session_count INTEGER,
+  total_duration REAL,
+  kb_sessions INTEGER,
+  sum_avg_cpm REAL,
+  sum_median_cpm REAL,
+  sum_avg_hold_time REAL,
+  sum_shortcut_count REAL,
+  sum_keystroke_count REAL,
+  mouse_sessions INTEGER,
+  sum_avg_dx REAL,
+  sum_avg_dy REAL,
+  sum_avg_scroll_distance REAL,
+  sum_avg_click_interval REAL,
+  sum_clicks_per_minute REAL,
+  PRIMARY KEY (day, label, context)
+);
+
+CREATE TABLE IF NOT EXISTS label_aggregates (
+  label TEXT NOT NULL,
+  context TEXT NOT NULL,
+  source TEXT NOT NULL,
+  column_name TEXT NOT NULL,
+  n INTEGER,
+  total REAL,
+  total_sq REAL,
+  min_value REAL,
+  max_value REAL,
+  hist BLOB,
+  PRIMARY KEY (label, context, source, column_name)
+);
+
+CREATE TABLE IF NOT EXISTS drift_sketches (
+  label TEXT NOT NULL,
+  feature TEXT NOT NULL,
+  baseline BLOB,
+  recent BLOB,
+  moments TEXT,
+  updated_at REAL,
+  PRIMARY KEY (label, feature)
+);
+
+CREATE TABLE IF NOT EXISTS drift_events (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  label TEXT NOT NULL,
+  feature TEXT NOT NULL,
+  detected_at REAL,
+  ks REAL,
+  threshold REAL,
+  baseline_n INTEGER,
+  recent_n INTEGER,
+  baseline_median REAL,
+  recent_median REAL,
+  decayed_mean REAL,
+  action TEXT,
+  handled INTEGER DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS session_features (
+  session_id TEXT NOT NULL,
+  version INTEGER NOT NULL,
+  features TEXT,
+  computed_at REAL,
+  PRIMARY KEY (session_id, version),
+  FOREIGN KEY(session_id) REFERENCES sessions(session_id)
+);
+
+CREATE TABLE IF NOT EXISTS backfill_progress (
+  version INTEGER PRIMARY KEY,
+  total INTEGER,
+  done INTEGER,
+  started_at REAL,
+  updated_at REAL,
+  finished_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS drift_imports (
+  file_name TEXT PRIMARY KEY,
+  imported_at REAL
+);
+
+"""
+
+# Ledger of the CSV exports bundled by the exporter, which creates it on its own
+EXPORT_BUNDLES_SQL = """
+CREATE TABLE IF NOT EXISTS export_bundles (
+  file_name TEXT PRIMARY KEY,
+  bundle TEXT,
+  sessions INTEGER,
+  bundled_at REAL
+);
+"""
+SCHEMA_SQL += EXPORT_BUNDLES_SQL
+
+# Aggregates of the sessions deleted by retention, created by the retention manager on its own;
+# rebuild_aggregates starts from them so label_aggregates keeps counting deleted sessions
+RETIRED_AGGREGATES_SQL = """
+CREATE TABLE IF NOT EXISTS retired_aggregates (
+  label TEXT NOT NULL,
+  context TEXT NOT NULL,
+  source TEXT NOT NULL,
+  column_name TEXT NOT NULL,
+  n INTEGER,
+  total REAL,
+  total_sq REAL,
+  min_value REAL,
+  max_value REAL,
+  hist BLOB,
+  PRIMARY KEY (label, context, source, column_name)
+);
 """
+SCHEMA_SQL += RETIRED_AGGREGATES_SQL
+
+# Columns added after the first release, created on existing DBs by create_schema
+MIGRATION_COLUMNS = {
+    "sessions": {"created_at": "REAL", "started_at": "REAL", "ended_at": "REAL"},
+    "mouse_data": {
+        "stroke_count": "INTEGER",
+        "avg_stroke_duration": "REAL",
+        "avg_straightness": "REAL",
+        "avg_curvature": "REAL",
+        "avg_stroke_velocity": "REAL",
+        "avg_peak_velocity_time": "REAL",
+        "avg_acceleration": "REAL",
+        "avg_overshoot": "REAL",
+        "avg_click_to_target": "REAL",
+    },
+}
+
+def aggregate_sessions(conn: sqlite3.Connection, where: str = "", params: tuple = ()) -> tuple[dict, int]:
+    """
+    Aggregate the keyboard/mouse rows of the sessions matching ``where`` (a clause on ``sessions s``)
+    :return: ({(source, label, context): {column: ColumnAggregate}}, number of rows aggregated)
+    """
+    aggregates: dict = {}
+    rows = 0
+    for source, edges in COLUMN_BIN_EDGES.items():
+        columns = list(edges)
+        cursor = conn.execute(
+            f"""
+            SELECT COALESCE(s.label, 'unlabeled'), COALESCE(s.context, ''),
+                   {", ".join(f"CAST(t.{c} AS REAL)" for c in columns)}
+            FROM {source} t JOIN sessions s ON s.session_id = t.session_id {where}
+            """,
+            params,
+        )
+        for label, context, *values in cursor:
+            group = aggregates.setdefault((source, label, context), {})
+            for column, value in zip(columns, values):
+                if value is not None:
+                    group.setdefault(column, ColumnAggregate(edges[column])).add(value)
+            rows += 1
+    return aggregates, rows
+
+
+def load_aggregates(conn: sqlite3.Connection, table: str, label: str, context: str,
+                    source: str) -> dict[str, ColumnAggregate]:
+    """Column aggregates of one (label, context, source) from ``label_aggregates`` or ``retired_aggregates``"""
+    edges = COLUMN_BIN_EDGES[source]
+    rows = conn.execute(
+        f"""
+        SELECT column_name, n, total, total_sq, min_value, max_value, hist FROM {table}
+        WHERE label = ? AND context = ? AND source = ?
+        """,
+        (label, context, source),
+    )
+    return {row[0]: ColumnAggregate.from_row(edges[row[0]], *row[1:]) for row in rows if row[0] in edges}
+
+
+def save_aggregates(conn: sqlite3.Connection, table: str, label: str, context: str, source: str,
+                    aggregates: dict[str, ColumnAggregate]) -> None:
+    conn.executemany(
+        f"""
+        INSERT OR REPLACE INTO {table}
+          (label, context, source, column_name, n, total, total_sq, min_value, max_value, hist)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (label, context, source, column, agg.n, agg.total, agg.total_sq, agg.min, agg.max, agg.hist_bytes())
+            for column, agg in aggregates.items()
+        ],
+    )
+
+
+def merge_aggregates(conn: sqlite3.Connection, table: str, aggregates: dict) -> None:
+    """Fold ``aggregate_sessions`` output into the rows of ``table``"""
+    for (source, label, context), group in aggregates.items():
+        merged = load_aggregates(conn, table, label, context, source)
+        for column, aggregate in group.items():
+            if column in merged:
+                merged[column].merge(aggregate)
+            else:
+                merged[column] = aggregate
+        save_aggregates(conn, table, label, context, source, merged)
+
 
 class EventStore:
     """
@@ -52,18 +276,52 @@ class EventStore:
 
     def create_schema(self) -> None:
         self.conn.executescript(SCHEMA_SQL)
+        self._add_missing_columns()
         self.conn.commit()
+        self._enable_incremental_vacuum()
+
+    def _enable_incremental_vacuum(self) -> None:
+        """
+        Databases created before auto_vacuum was enabled need one full VACUUM to
+        switch to incremental mode. Done here, at startup before capture writes,
+        so the retention thread only ever runs ``incremental_vacuum``.
+        """
+        if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        self.logger.info("Enabling incremental auto_vacuum (full VACUUM)")
+        self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.conn.execute("VACUUM")
+
+    def _add_missing_columns(self) -> None:
+        """Bring tables created by older versions up to date"""
+        for table, columns in MIGRATION_COLUMNS.items():
+            existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            for column, col_type in columns.items():
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
+                    self.logger.info(f"Added column {table}.{column}")
+                    if (table, column) == ("sessions", "created_at"):
+                        # Sessions recorded before created_at existed are dated at migration time
+                        self.conn.execute("UPDATE sessions SET created_at = ? WHERE created_at IS NULL", (time.time(),))
+
+    def has_session(self, session_id: str) -> bool:
+        return self.conn.execute(
+            "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone() is not None
 
     def upsert_session(self, session_id: str, **kwargs) -> None:
         self.conn.execute(
             """
-            INSERT INTO sessions (session_id, context, duration, label)
-            VALUES (:session_id, :context, :duration, :label)
+            INSERT INTO sessions (session_id, context, duration, label, created_at, started_at, ended_at)
+            VALUES (:session_id, :context, :duration, :label, :created_at, :started_at, :ended_at)
             ON CONFLICT(session_id) DO UPDATE SET
               context=COALESCE(:context, context),
-              duration=COALESCE(:duration, duration)
+              duration=COALESCE(:duration, duration),
+              started_at=COALESCE(:started_at, started_at),
+              ended_at=COALESCE(:ended_at, ended_at)
             """,
-            {"session_id": session_id, **kwargs, "label": self.label},
+            {"session_id": session_id, "created_at": time.time(), "started_at": None, "ended_at": None,
+             **kwargs, "label": self.label},
         )
         self.conn.commit()
         self.logger.info(f"Upserted session {session_id}")
@@ -77,12 +335,25 @@ class EventStore:
                 avg_dy, 
                 avg_scroll_distance, 
                 avg_click_interval, 
-                clicks_per_minute
+                clicks_per_minute,
+                stroke_count,
+                avg_stroke_duration,
+                avg_straightness,
+                avg_curvature,
+                avg_stroke_velocity,
+                avg_peak_velocity_time,
+                avg_acceleration,
+                avg_overshoot,
+                avg_click_to_target
             )
-            VALUES (:session_id, :avg_dx, :avg_dy, :avg_scroll_distance, :avg_click_interval, :clicks_per_minute)
+            VALUES (:session_id, :avg_dx, :avg_dy, :avg_scroll_distance, :avg_click_interval, :clicks_per_minute,
+                    :stroke_count, :avg_stroke_duration, :avg_straightness, :avg_curvature, :avg_stroke_velocity,
+                    :avg_peak_velocity_time, :avg_acceleration, :avg_overshoot, :avg_click_to_target)
             """,
-            {"session_id": session_id, **kwargs},
+            # Stroke columns are optional, rows written before strokes were captured leave them NULL
+            {"session_id": session_id, **dict.fromkeys(MIGRATION_COLUMNS["mouse_data"]), **kwargs},
         )
+        self._update_aggregates("mouse_data", session_id, kwargs)
         self.conn.commit()
         self.logger.info(f"Upserted mouse_data {session_id}")
 
@@ -102,9 +373,117 @@ class EventStore:
 
             {"session_id": session_id, **kwargs},
         )
+        self._update_aggregates("keyboard_data", session_id, kwargs)
         self.conn.commit()
         self.logger.info(f"Upserted keyboard_data {session_id}")
 
+    def upsert_kb_timing(self, session_id: str, dwell: TimingMatrix, flight: TimingMatrix) -> None:
+        self.conn.execute(
+            """
+            INSERT INTO keystroke_timing (session_id, n_classes, n_bins, dwell_hist, flight_hist)
+            VALUES (:session_id, :n_classes, :n_bins, :dwell_hist, :flight_hist)
+            """,
+            {
+                "session_id": session_id,
+                "n_classes": N_CLASSES,
+                "n_bins": N_BINS,
+                "dwell_hist": dwell.to_bytes(),
+                "flight_hist": flight.to_bytes(),
+            },
+        )
+        self.conn.commit()
+        self.logger.info(f"Upserted keystroke_timing {session_id}")
+
+    def get_kb_timing(self, session_id: str) -> tuple[TimingMatrix, TimingMatrix] | None:
+        """Load the (dwell, flight) histograms of a session"""
+        row = self.conn.execute(
+            "SELECT dwell_hist, flight_hist FROM keystroke_timing WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return TimingMatrix.from_bytes(row[0]), TimingMatrix.from_bytes(row[1])
+
+    def upsert_session_features(self, rows: list[tuple[str, int, str]], commit: bool = True) -> None:
+        """
+        Bulk write computed features
+        :param rows: ``(session_id, version, features JSON)`` tuples
+        :param commit: False when the caller commits as part of a larger transaction
+        """
+        now = time.time()
+        self.conn.executemany(
+            """
+            INSERT OR REPLACE INTO session_features (session_id, version, features, computed_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            [(*row, now) for row in rows],
+        )
+        if commit:
+            self.conn.commit()
+
+    def get_session_features(self, session_id: str, version: int) -> dict | None:
+        row = self.conn.execute(
+            "SELECT features FROM session_features WHERE session_id = ? AND version = ?", (session_id, version)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _update_aggregates(self, source: str, session_id: str, values: dict) -> None:
+        """Fold one inserted row into its (label, context) aggregates, inside the caller's transaction"""
+        row = self.conn.execute(
+            "SELECT COALESCE(label, 'unlabeled'), COALESCE(context, '') FROM sessions WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return
+        label, context = row
+
+        edges = COLUMN_BIN_EDGES[source]
+        aggregates = load_aggregates(self.conn, "label_aggregates", label, context, source)
+        for column, column_edges in edges.items():
+            if values.get(column) is None:
+                continue
+            aggregates.setdefault(column, ColumnAggregate(column_edges)).add(float(values[column]))
+        save_aggregates(self.conn, "label_aggregates", label, context, source, aggregates)
+
+    def rebuild_aggregates(self) -> int:
+        """
+        Recompute ``label_aggregates`` from the session tables, on top of the
+        aggregates of the sessions already deleted by retention
+        :return: number of rows aggregated
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM label_aggregates")
+            self.conn.execute("INSERT INTO label_aggregates SELECT * FROM retired_aggregates")
+            aggregates, rows = aggregate_sessions(self.conn)
+            merge_aggregates(self.conn, "label_aggregates", aggregates)
+        self.logger.info(f"Rebuilt label aggregates from {rows} rows")
+        return rows
+
+    def label_summary(self, by_context: bool = False) -> dict:
+        """
+        Per-label statistics of every keyboard/mouse column, read from ``label_aggregates``
+        :param by_context: key the result by ``(label, context)`` instead of merging contexts
+        :return: {label: {"<source>.<column>": ColumnAggregate}}
+        """
+        summary: dict = {}
+        rows = self.conn.execute(
+            """
+            SELECT label, context, source, column_name, n, total, total_sq, min_value, max_value, hist
+            FROM label_aggregates
+            """
+        )
+        for label, context, source, column, *values in rows:
+            edges = COLUMN_BIN_EDGES.get(source, {}).get(column)
+            if edges is None:
+                continue
+            aggregate = ColumnAggregate.from_row(edges, *values)
+            columns = summary.setdefault((label, context) if by_context else label, {})
+            key = f"{source}.{column}"
+            if key in columns:
+                columns[key].merge(aggregate)
+            else:
+                columns[key] = aggregate
+        return summary
 
     def close(self):
         self.conn.close()